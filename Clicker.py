@@ -1,30 +1,78 @@
 import tkinter as tk
-from tkinter import messagebox, filedialog, ttk, scrolledtext
-import pyautogui
+from tkinter import messagebox, filedialog, simpledialog, ttk, scrolledtext
 import threading
-import time
+import queue
 import keyboard
-import json
-from datetime import datetime
+import sys
+from backends import PyAutoGuiBackend
+from control import Controller, ControlServer, DEFAULT_ADDRESS
+from engine import Engine, compile_action, describe_action, TemplateError
+from listview import SequenceView
+from recorder import Recorder
+from triggers import TriggerRunner, HotkeyTrigger, TimerTrigger, ScreenTrigger
+from logbuffer import LogBuffer, RotatingLogWriter, DEBUG, INFO, WARNING, ERROR
+import templates
+
+TEMPLATE_FILETYPES = [("Templates", "*.json *.jsonl"), ("JSON files", "*.json"), ("JSON lines", "*.jsonl")]
 
 class AutoClickerApp:
     """
     A feature-rich application for automating mouse and keyboard actions.
     """
-    def __init__(self, root):
+    # Jump menu label -> 'when' value stored in the action
+    JUMP_WHEN = {"always": "always", "if condition fails": "fail", "if condition matches": "match"}
+
+    # Log menu label -> (minimum level, keep every n-th per-action line)
+    LOG_VERBOSITY = {
+        "All Actions": (DEBUG, 1),
+        "Every 10th Action": (DEBUG, 10),
+        "Every 100th Action": (DEBUG, 100),
+        "No Action Lines": (INFO, 1),
+        "Warnings Only": (WARNING, 1),
+    }
+
+    def __init__(self, root, backend=None):
         self.root = root
         self.root.title("Auto-Clicker Manager")
         self.root.geometry("650x850") # Adjusted size for better layout
         self.root.minsize(600, 700)
 
         # --- App State ---
+        self.log_buffer = LogBuffer()
+        self.log_interval = 100 # ms between log widget flushes
+        self.log_widget_lines = 0
+        self.log_verbosity = tk.StringVar(value="All Actions")
+        self.mouse_refresh_ms = tk.IntVar(value=100) # 0 = display off
+        self.last_mouse_sample = None
+        self.mouse_idle_ticks = 0
         self.actions = []
-        self.running = False
-        self.automation_thread = None
+        self.subroutines = {} # name -> action list, callable from any template
+        self.plan = []
+        self.template_loader = None # set while a template loads in the background
+        self.backend = backend or PyAutoGuiBackend()
+        self.engine = Engine(self.backend, log=self.log)
+        # Starts and stops go through one command queue; hotkey and worker threads reach Tk only through ui_queue
+        self.controller = Controller(self.engine, source=self._snapshot_sequence, on_loaded=self._on_remote_load, on_finished=self._on_run_finished)
+        self.control_server = None
+        self.pending_load = None # (actions, subroutines) loaded remotely but not yet shown in the list
+        # Triggered sequences share the engine's input lock, so they never interleave input with a run
+        self.triggers = TriggerRunner(self.backend, log=self.log)
+        self.engine.input_lock = self.triggers.input_lock
+        self.control_api = tk.BooleanVar(value=False)
+        self.ui_queue = queue.SimpleQueue()
         self.time_delay = 1.0
         self.loop_count = 0
+        self.target_rate = 0.0
+        self.loop_pause = 0.1
         self.stop_on_fail = tk.BooleanVar(value=False)
+        self.turbo = tk.BooleanVar(value=False)
         self.captured_key = tk.StringVar(value="")
+        self.template_image = tk.StringVar(value="")
+        self.frame_ttl = tk.DoubleVar(value=0.1) # 0 = keep one frame for the whole pass
+        self.recorder = None
+        self.replay_speed = tk.DoubleVar(value=1.0) # 0 = ignore recorded delays
+        self.profile_runs = tk.BooleanVar(value=True)
+        self.profile_shown = None # (profile, sample count) last drawn in the performance panel
 
         # --- Theme Colors ---
         self.themes = {
@@ -47,6 +95,9 @@ class AutoClickerApp:
         self.setup_ui()
         self.apply_theme("Dark")
         self.update_mouse_position()
+        self.flush_log()
+        self.process_ui_queue()
+        self.update_profile_panel()
         self.setup_global_shortcuts()
         self.log("Application initialized. Press Ctrl+S to start/stop, Ctrl+P to pick coordinates.")
 
@@ -61,6 +112,7 @@ class AutoClickerApp:
         self._setup_config_frame()
         self._setup_sequence_frame()
         self._setup_control_frame()
+        self._setup_profile_frame()
         self._setup_log_frame()
 
         self.update_input_fields()
@@ -72,7 +124,13 @@ class AutoClickerApp:
         self.menu_bar.add_cascade(label="File", menu=file_menu)
         file_menu.add_command(label="Save Template", command=self.save_template)
         file_menu.add_command(label="Load Template", command=self.load_template)
+        file_menu.add_command(label="Export as Plain JSON...", command=self.export_json)
         file_menu.add_command(label="Save Log", command=self.save_log)
+        file_menu.add_command(label="Export Run Profile...", command=self.export_profile)
+        file_menu.add_separator()
+        file_menu.add_command(label="Save Sequence as Subroutine...", command=self.save_as_subroutine)
+        file_menu.add_command(label="Load Subroutine Library", command=self.load_subroutines)
+        file_menu.add_command(label="Save Subroutine Library", command=self.save_subroutines)
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.stop_script)
 
@@ -82,6 +140,38 @@ class AutoClickerApp:
         options_menu.add_cascade(label="Themes", menu=theme_menu)
         theme_menu.add_command(label="Dark", command=lambda: self.apply_theme("Dark"))
         theme_menu.add_command(label="Light", command=lambda: self.apply_theme("Light"))
+        ttl_menu = tk.Menu(options_menu, tearoff=0)
+        options_menu.add_cascade(label="Color Check Frame TTL", menu=ttl_menu)
+        for label, value in [("Whole Pass", 0.0), ("50 ms", 0.05), ("100 ms", 0.1), ("250 ms", 0.25)]:
+            ttl_menu.add_radiobutton(label=label, variable=self.frame_ttl, value=value)
+        refresh_menu = tk.Menu(options_menu, tearoff=0)
+        options_menu.add_cascade(label="Mouse Display Refresh", menu=refresh_menu)
+        for label, value in [("Off", 0), ("5 Hz", 200), ("10 Hz", 100), ("20 Hz", 50), ("30 Hz", 33)]:
+            refresh_menu.add_radiobutton(label=label, variable=self.mouse_refresh_ms, value=value)
+        replay_menu = tk.Menu(options_menu, tearoff=0)
+        options_menu.add_cascade(label="Recorded Timing", menu=replay_menu)
+        for label, value in [("Original Speed", 1.0), ("2x Faster", 2.0), ("4x Faster", 4.0), ("2x Slower", 0.5), ("Ignore (use Time Delay)", 0.0)]:
+            replay_menu.add_radiobutton(label=label, variable=self.replay_speed, value=value)
+        options_menu.add_checkbutton(label="Profile Runs", variable=self.profile_runs)
+        options_menu.add_checkbutton(label=f"Control API ({DEFAULT_ADDRESS})", variable=self.control_api, command=self.toggle_control_api)
+        log_menu = tk.Menu(options_menu, tearoff=0)
+        options_menu.add_cascade(label="Logging", menu=log_menu)
+        for label in self.LOG_VERBOSITY:
+            log_menu.add_radiobutton(label=label, variable=self.log_verbosity, value=label, command=self.apply_log_verbosity)
+        log_menu.add_separator()
+        log_menu.add_command(label="Stream Log to File...", command=self.start_log_file)
+        log_menu.add_command(label="Stop Streaming Log", command=self.stop_log_file)
+
+        triggers_menu = tk.Menu(self.menu_bar, tearoff=0)
+        self.menu_bar.add_cascade(label="Triggers", menu=triggers_menu)
+        triggers_menu.add_command(label="Add Sequence on Hotkey...", command=lambda: self.add_triggered_sequence("hotkey"))
+        triggers_menu.add_command(label="Add Sequence on Timer...", command=lambda: self.add_triggered_sequence("timer"))
+        triggers_menu.add_command(label="Add Sequence on Screen Condition...", command=lambda: self.add_triggered_sequence("screen"))
+        triggers_menu.add_separator()
+        triggers_menu.add_command(label="Start Triggers", command=self.start_triggers)
+        triggers_menu.add_command(label="Stop Triggers", command=self.stop_triggers)
+        triggers_menu.add_command(label="Show Trigger Status", command=self.show_trigger_status)
+        triggers_menu.add_command(label="Remove All Triggers", command=self.clear_triggers)
 
     def _setup_mouse_display(self):
         self.mouse_position_label = tk.Label(self.root, text="Mouse Position: X=0, Y=0, Color=(0, 0, 0)", font=("Arial", 10))
@@ -94,7 +184,7 @@ class AutoClickerApp:
 
         tk.Label(self.config_frame, text="Action Type:", font=("Arial", 11)).grid(row=0, column=0, padx=5, sticky="w")
         self.action_type = tk.StringVar(value="Left Click")
-        action_menu = ttk.OptionMenu(self.config_frame, self.action_type, "Left Click", "Left Click", "Right Click", "Double Click", "Scroll", "Key Press", command=lambda e: self.update_input_fields())
+        action_menu = ttk.OptionMenu(self.config_frame, self.action_type, "Left Click", "Left Click", "Right Click", "Double Click", "Scroll", "Move", "Key Press", "Wait For", "Label", "Jump", "Repeat", "End Repeat", "Call", command=lambda e: self.update_input_fields())
         action_menu.grid(row=0, column=1, columnspan=3, padx=5, sticky="ew")
 
         self.input_fields_frame = tk.Frame(self.config_frame)
@@ -108,6 +198,21 @@ class AutoClickerApp:
         self.g_label = tk.Label(self.input_fields_frame, text="G:", font=font_small); self.g_entry = tk.Entry(self.input_fields_frame, width=8, borderwidth=2, relief="solid")
         self.b_label = tk.Label(self.input_fields_frame, text="B:", font=font_small); self.b_entry = tk.Entry(self.input_fields_frame, width=8, borderwidth=2, relief="solid")
         self.scroll_label = tk.Label(self.input_fields_frame, text="Scroll Amt:", font=font_small); self.scroll_entry = tk.Entry(self.input_fields_frame, width=10, borderwidth=2, relief="solid")
+        self.tol_label = tk.Label(self.input_fields_frame, text="Tolerance:", font=font_small); self.tol_entry = tk.Entry(self.input_fields_frame, width=8, borderwidth=2, relief="solid")
+        self.area_w_label = tk.Label(self.input_fields_frame, text="Area W:", font=font_small); self.area_w_entry = tk.Entry(self.input_fields_frame, width=8, borderwidth=2, relief="solid")
+        self.area_h_label = tk.Label(self.input_fields_frame, text="Area H:", font=font_small); self.area_h_entry = tk.Entry(self.input_fields_frame, width=8, borderwidth=2, relief="solid")
+        self.match_label = tk.Label(self.input_fields_frame, text="Match %:", font=font_small); self.match_entry = tk.Entry(self.input_fields_frame, width=8, borderwidth=2, relief="solid")
+        self.template_button = tk.Button(self.input_fields_frame, text="Find Image...", command=self.choose_template_image, font=("Arial", 10))
+        self.template_display = tk.Label(self.input_fields_frame, textvariable=self.template_image, font=("Arial", 10, "italic"), relief="sunken", bd=1, width=20, anchor="w")
+        self.until_label = tk.Label(self.input_fields_frame, text="Until:", font=font_small)
+        self.wait_until = tk.StringVar(value="appears")
+        self.until_menu = ttk.OptionMenu(self.input_fields_frame, self.wait_until, "appears", "appears", "disappears")
+        self.timeout_label = tk.Label(self.input_fields_frame, text="Timeout (s):", font=font_small); self.timeout_entry = tk.Entry(self.input_fields_frame, width=8, borderwidth=2, relief="solid"); self.timeout_entry.insert(0, "10")
+        self.name_label = tk.Label(self.input_fields_frame, text="Name:", font=font_small); self.name_entry = tk.Entry(self.input_fields_frame, width=20, borderwidth=2, relief="solid")
+        self.count_label = tk.Label(self.input_fields_frame, text="Count:", font=font_small); self.count_entry = tk.Entry(self.input_fields_frame, width=8, borderwidth=2, relief="solid")
+        self.when_label = tk.Label(self.input_fields_frame, text="Jump:", font=font_small)
+        self.jump_when = tk.StringVar(value="always")
+        self.when_menu = ttk.OptionMenu(self.input_fields_frame, self.jump_when, "always", *self.JUMP_WHEN, command=lambda e: self.update_input_fields())
 
         self.key_label = tk.Label(self.input_fields_frame, text="Key:", font=font_small)
         self.key_capture_button = tk.Button(self.input_fields_frame, text="Capture Key", command=self.start_key_capture, font=("Arial", 10))
@@ -119,6 +224,9 @@ class AutoClickerApp:
         tk.Label(self.config_frame, text="Loops (0=inf):", font=font_small).grid(row=2, column=2, padx=5, pady=(10,0), sticky="w")
         self.loop_entry = tk.Entry(self.config_frame, width=10, borderwidth=2, relief="solid"); self.loop_entry.grid(row=2, column=3, padx=5, pady=(10,0), sticky="w"); self.loop_entry.insert(0, str(self.loop_count))
 
+        tk.Label(self.config_frame, text="Target Actions/s (0=off):", font=font_small).grid(row=3, column=0, columnspan=2, padx=5, pady=(10,0), sticky="w")
+        self.rate_entry = tk.Entry(self.config_frame, width=10, borderwidth=2, relief="solid"); self.rate_entry.grid(row=3, column=2, padx=5, pady=(10,0), sticky="w"); self.rate_entry.insert(0, "0")
+
     def _setup_sequence_frame(self):
         """Frame for displaying and managing the action sequence."""
         self.sequence_frame = tk.LabelFrame(self.root, text="Action Sequence", font=("Arial", 12, "bold"), padx=10, pady=10)
@@ -127,11 +235,16 @@ class AutoClickerApp:
 
         self.listbox = tk.Listbox(self.sequence_frame, height=10, font=("Arial", 10), exportselection=False)
         self.listbox.grid(row=0, column=0, sticky="nsew", rowspan=2)
+        self.list_scrollbar = tk.Scrollbar(self.sequence_frame, orient="vertical")
+        self.list_scrollbar.grid(row=0, column=1, sticky="ns", rowspan=2)
+        # Only the visible rows live in the Listbox; the view maps them onto self.actions
+        self.sequence_view = SequenceView(self.listbox, self.list_scrollbar, self.actions, describe_action)
+        self.engine.on_step = self.sequence_view.request_highlight
 
         up_button = tk.Button(self.sequence_frame, text="↑", command=self.move_up, font=("Arial", 12, "bold"), relief="raised", bd=3)
-        up_button.grid(row=0, column=1, padx=(10,0), sticky="ew")
+        up_button.grid(row=0, column=2, padx=(10,0), sticky="ew")
         down_button = tk.Button(self.sequence_frame, text="↓", command=self.move_down, font=("Arial", 12, "bold"), relief="raised", bd=3)
-        down_button.grid(row=1, column=1, padx=(10,0), sticky="ew")
+        down_button.grid(row=1, column=2, padx=(10,0), sticky="ew")
 
     def _setup_control_frame(self):
         """Frame for the main control buttons."""
@@ -147,10 +260,21 @@ class AutoClickerApp:
 
         stop_on_fail_check = tk.Checkbutton(self.control_frame, text="If one operation failed - stop", variable=self.stop_on_fail, font=("Arial", 10))
         stop_on_fail_check.grid(row=1, column=0, columnspan=2, padx=5, pady=5, sticky="w")
+        turbo_check = tk.Checkbutton(self.control_frame, text="Turbo (no input pauses, merge repeats)", variable=self.turbo, font=("Arial", 10))
+        turbo_check.grid(row=1, column=1, columnspan=2, padx=5, pady=5, sticky="w")
+        self.record_button = tk.Button(self.control_frame, text="Record", command=lambda: self.toggle_recording(from_button=True), font=btn_font, relief="raised", bd=3)
+        self.record_button.grid(row=1, column=3, padx=5, pady=5, sticky="ew")
 
-        shortcuts_label = tk.Label(self.control_frame, text="Shortcuts: Start/Stop (Ctrl+S) | Pick Color (Ctrl+P)", font=("Arial", 9, "italic"))
+        shortcuts_label = tk.Label(self.control_frame, text="Shortcuts: Start/Stop (Ctrl+S) | Pick Color (Ctrl+P) | Record (Ctrl+R) | Emergency stop: mouse to a screen corner", font=("Arial", 9, "italic"))
         shortcuts_label.grid(row=2, column=0, columnspan=4, pady=(10,0), sticky="w")
 
+    def _setup_profile_frame(self):
+        """Live per-phase timings of the current (or last) run."""
+        self.profile_frame = tk.LabelFrame(self.root, text="Performance", font=("Arial", 12, "bold"), padx=10, pady=5)
+        self.profile_frame.pack(padx=10, fill="x")
+        self.profile_label = tk.Label(self.profile_frame, text="No run profiled yet.", font=("Courier", 9), justify="left", anchor="w")
+        self.profile_label.pack(fill="x")
+
     def _setup_log_frame(self):
         """Creates the logging area."""
         self.log_frame = tk.LabelFrame(self.root, text="Log", font=("Arial", 12, "bold"), padx=10, pady=10)
@@ -168,11 +292,12 @@ class AutoClickerApp:
         self.root.configure(bg=theme["bg"])
 
         # Configure all LabelFrames
-        for frame in [self.config_frame, self.sequence_frame, self.control_frame, self.log_frame]:
+        for frame in [self.config_frame, self.sequence_frame, self.control_frame, self.profile_frame, self.log_frame]:
             frame.config(bg=theme["bg"], fg=theme["fg"])
 
         # Configure other widgets
         self.mouse_position_label.config(bg=theme["bg"], fg=theme["label_fg"])
+        self.profile_label.config(bg=theme["bg"], fg=theme["label_fg"])
         self.listbox.config(bg=theme["list_bg"], fg=theme["list_fg"], selectbackground=theme["select_bg"], selectforeground=theme["select_fg"])
         self.log_area.config(bg=theme["log_bg"], fg=theme["log_fg"])
 
@@ -196,93 +321,197 @@ class AutoClickerApp:
     def update_input_fields(self):
         for widget in self.input_fields_frame.winfo_children(): widget.grid_forget()
         action = self.action_type.get()
-        if action in ["Left Click", "Right Click", "Double Click", "Scroll"]:
+        if action == "Jump":
+            self.name_label.grid(row=6, column=0, padx=5, pady=2, sticky="w"); self.name_entry.grid(row=6, column=1, columnspan=2, padx=5, pady=2, sticky="w")
+            self.when_label.grid(row=6, column=3, padx=5, pady=2, sticky="w"); self.when_menu.grid(row=6, column=4, columnspan=2, padx=5, pady=2, sticky="w")
+        if action in ["Left Click", "Right Click", "Double Click", "Scroll", "Move", "Wait For"] or (action == "Jump" and self.jump_when.get() != "always"):
             self.x_label.grid(row=0, column=0, padx=5, pady=2, sticky="w"); self.x_entry.grid(row=0, column=1, padx=5, pady=2)
             self.y_label.grid(row=0, column=2, padx=5, pady=2, sticky="w"); self.y_entry.grid(row=0, column=3, padx=5, pady=2)
             self.r_label.grid(row=1, column=0, padx=5, pady=2, sticky="w"); self.r_entry.grid(row=1, column=1, padx=5, pady=2)
             self.g_label.grid(row=1, column=2, padx=5, pady=2, sticky="w"); self.g_entry.grid(row=1, column=3, padx=5, pady=2)
             self.b_label.grid(row=1, column=4, padx=5, pady=2, sticky="w"); self.b_entry.grid(row=1, column=5, padx=5, pady=2)
             if action == "Scroll": self.scroll_label.grid(row=2, column=0, padx=5, pady=2, sticky="w"); self.scroll_entry.grid(row=2, column=1, padx=5, pady=2)
+            self.tol_label.grid(row=3, column=0, padx=5, pady=2, sticky="w"); self.tol_entry.grid(row=3, column=1, padx=5, pady=2)
+            self.area_w_label.grid(row=3, column=2, padx=5, pady=2, sticky="w"); self.area_w_entry.grid(row=3, column=3, padx=5, pady=2)
+            self.area_h_label.grid(row=3, column=4, padx=5, pady=2, sticky="w"); self.area_h_entry.grid(row=3, column=5, padx=5, pady=2)
+            self.match_label.grid(row=4, column=0, padx=5, pady=2, sticky="w"); self.match_entry.grid(row=4, column=1, padx=5, pady=2)
+            self.template_button.grid(row=4, column=2, columnspan=2, padx=5, pady=2, sticky="ew"); self.template_display.grid(row=4, column=4, columnspan=2, padx=5, pady=2)
+            if action == "Wait For":
+                self.until_label.grid(row=5, column=0, padx=5, pady=2, sticky="w"); self.until_menu.grid(row=5, column=1, columnspan=2, padx=5, pady=2, sticky="w")
+                self.timeout_label.grid(row=5, column=3, padx=5, pady=2, sticky="w"); self.timeout_entry.grid(row=5, column=4, padx=5, pady=2)
         elif action == "Key Press":
             self.key_label.grid(row=0, column=0, padx=5, pady=2, sticky="w")
             self.key_capture_button.grid(row=0, column=1, padx=5, pady=2)
             self.captured_key_display.grid(row=0, column=2, padx=5, pady=2)
+        elif action in ["Label", "Call"]:
+            self.name_label.grid(row=0, column=0, padx=5, pady=2, sticky="w"); self.name_entry.grid(row=0, column=1, columnspan=2, padx=5, pady=2, sticky="w")
+        elif action == "Repeat":
+            self.count_label.grid(row=0, column=0, padx=5, pady=2, sticky="w"); self.count_entry.grid(row=0, column=1, padx=5, pady=2)
+
+    def log(self, message, level=INFO):
+        """Buffers a log line; safe to call from any thread. The widget is updated by `flush_log`."""
+        self.log_buffer.emit(message, level)
+
+    def flush_log(self):
+        """Moves buffered log lines into the log widget in one batch, then reschedules itself."""
+        lines = self.log_buffer.drain()
+        if lines:
+            text = "".join(lines)
+            if sys.stdout is not None: sys.stdout.write(text) # None under pythonw and frozen GUI builds
+            self.log_area.config(state='normal')
+            self.log_area.insert(tk.END, text)
+            self.log_widget_lines += text.count("\n") # Entries can span several lines
+            # Trim the log if it exceeds a certain number of lines
+            if self.log_widget_lines > 1000:
+                excess = self.log_widget_lines - 500
+                self.log_area.delete('1.0', f'{excess + 1}.0')
+                self.log_widget_lines -= excess
+            self.log_area.see(tk.END)
+            self.log_area.config(state='disabled')
+        self.root.after(self.log_interval, self.flush_log)
+
+    def update_profile_panel(self):
+        """Redraws the performance panel when the engine's profile has new samples, then reschedules itself."""
+        profile = self.engine.profile
+        if profile is not None:
+            samples = profile.dispatch.count + profile.wait.count
+            if self.profile_shown != (profile, samples):
+                self.profile_shown = (profile, samples)
+                self.profile_label.config(text=profile.summary_text() or "No actions executed yet.")
+        self.root.after(500, self.update_profile_panel)
+
+    def apply_log_verbosity(self):
+        self.log_buffer.level, self.log_buffer.sample_every = self.LOG_VERBOSITY[self.log_verbosity.get()]
+
+    def start_log_file(self):
+        filepath = filedialog.asksaveasfilename(defaultextension=".log", filetypes=[("Log files", "*.log"), ("Text files", "*.txt")], title="Stream Log to File")
+        if not filepath: return
+        try:
+            self.stop_log_file()
+            self.log_buffer.writer = RotatingLogWriter(filepath)
+            self.log(f"Streaming log to {filepath}")
+        except Exception as e: messagebox.showerror("Error", f"Failed to open log file: {e}")
 
-    def log(self, message):
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        log_message = f"[{timestamp}] {message}\n"
-        self.root.after(0, self.update_log_widget, log_message)
-        print(log_message.strip())
-
-    def update_log_widget(self, message):
-        self.log_area.config(state='normal')
-        self.log_area.insert(tk.END, message)
-        self.log_area.see(tk.END)
-
-        # Trim the log if it exceeds a certain number of lines
-        num_lines = int(self.log_area.index('end-1c').split('.')[0])
-        if num_lines > 1000:
-            self.log_area.delete('1.0', '501.0')
-
-        self.log_area.config(state='disabled')
+    def stop_log_file(self):
+        writer, self.log_buffer.writer = self.log_buffer.writer, None
+        if writer: writer.close(); self.log(f"Stopped streaming log to {writer.path}")
 
     def update_mouse_position(self):
+        """
+        Samples the cursor position and the color under it, then reschedules itself.
+
+        Only a 1x1 region is captured, and only when the cursor moved (or about
+        once a second while it rests). Sampling backs off while a run is active
+        and pauses while the window is minimized or the display is turned off.
+        """
+        interval = self.mouse_refresh_ms.get()
+        if not interval or self.root.state() in ("iconic", "withdrawn"):
+            self.last_mouse_sample = None
+            self.root.after(500, self.update_mouse_position)
+            return
         try:
-            x, y = pyautogui.position(); color = pyautogui.pixel(x, y)
-            self.mouse_position_label.config(text=f"Mouse Position: X={x}, Y={y}, Color={color}")
+            x, y = self.backend.position()
+            self.mouse_idle_ticks += 1
+            if self.last_mouse_sample is None or self.last_mouse_sample[:2] != (x, y) or self.mouse_idle_ticks * interval >= 1000:
+                color = self.backend.pixel(x, y)
+                if self.last_mouse_sample != (x, y, color):
+                    self.last_mouse_sample = (x, y, color)
+                    self.mouse_position_label.config(text=f"Mouse Position: X={x}, Y={y}, Color={color}")
+                self.mouse_idle_ticks = 0
         except Exception:
+            self.last_mouse_sample = None
             self.mouse_position_label.config(text="Mouse Position: N/A, Color=N/A")
-        self.root.after(100, self.update_mouse_position)
+        if self.running: interval = max(interval * 4, 250) # Leave the CPU to the automation thread
+        self.root.after(interval, self.update_mouse_position)
 
     def setup_global_shortcuts(self):
         threading.Thread(target=self.monitor_shortcuts, daemon=True).start()
 
     def monitor_shortcuts(self):
-        keyboard.add_hotkey("ctrl+s", self.toggle_automation)
-        keyboard.add_hotkey("ctrl+p", self.activate_color_picker)
-        keyboard.add_hotkey("ctrl+q", self.stop_script)
+        keyboard.add_hotkey("ctrl+s", self.post, args=(self.toggle_automation,))
+        keyboard.add_hotkey("ctrl+p", self.post, args=(self.activate_color_picker,))
+        keyboard.add_hotkey("ctrl+q", self.post, args=(self.stop_script,))
+        keyboard.add_hotkey("ctrl+r", self.post, args=(self.toggle_recording,))
         keyboard.wait()
 
+    def post(self, callback, *args):
+        """Runs `callback(*args)` on the Tk main thread. Safe to call from any thread."""
+        self.ui_queue.put((callback, args))
+
+    def process_ui_queue(self):
+        """Runs the callbacks posted from other threads, then reschedules itself."""
+        while True:
+            try: callback, args = self.ui_queue.get_nowait()
+            except queue.Empty: break
+            try: callback(*args)
+            except Exception as e: self.log(f"Error in {getattr(callback, '__name__', callback)}: {e!r}", ERROR) # Keep the pump alive
+        self.root.after(20, self.process_ui_queue)
+
+    def _read_condition_fields(self, new_action):
+        """Fills X/Y and the optional color, tolerance, area and image condition of `new_action` from the input fields."""
+        new_action["x"] = int(self.x_entry.get()); new_action["y"] = int(self.y_entry.get())
+        r, g, b = self.r_entry.get(), self.g_entry.get(), self.b_entry.get()
+        new_action["color"] = (int(r), int(g), int(b)) if r and g and b else None
+        if self.tol_entry.get(): new_action["tolerance"] = int(self.tol_entry.get())
+        w, h = self.area_w_entry.get(), self.area_h_entry.get()
+        if w and h:
+            w, h = int(w), int(h) # Area centered on X, Y
+            new_action["region"] = (new_action["x"] - w // 2, new_action["y"] - h // 2, w, h)
+            if self.match_entry.get(): new_action["match_percent"] = float(self.match_entry.get())
+        if self.template_image.get(): new_action["template"] = self.template_image.get()
+
     def add_action(self):
         action_type = self.action_type.get(); new_action = {"type": action_type}
         try:
-            if action_type in ["Left Click", "Right Click", "Double Click", "Scroll"]:
-                new_action["x"] = int(self.x_entry.get()); new_action["y"] = int(self.y_entry.get())
-                r, g, b = self.r_entry.get(), self.g_entry.get(), self.b_entry.get()
-                new_action["color"] = (int(r), int(g), int(b)) if r and g and b else None
+            if action_type in ["Left Click", "Right Click", "Double Click", "Scroll", "Move", "Wait For"]:
+                self._read_condition_fields(new_action)
                 if action_type == "Scroll": new_action["amount"] = int(self.scroll_entry.get())
+                if action_type == "Wait For":
+                    new_action["until"] = self.wait_until.get()
+                    new_action["timeout"] = float(self.timeout_entry.get())
             elif action_type == "Key Press":
                 key = self.captured_key.get()
                 if not key: raise ValueError("No key captured. Please capture a key first.")
                 new_action["key"] = key
-            self.actions.append(new_action); self.refresh_listbox()
+            elif action_type in ["Label", "Call"]:
+                new_action["name"] = self.name_entry.get().strip()
+            elif action_type == "Jump":
+                new_action["name"] = self.name_entry.get().strip()
+                new_action["when"] = self.JUMP_WHEN[self.jump_when.get()]
+                if new_action["when"] != "always": self._read_condition_fields(new_action)
+            elif action_type == "Repeat":
+                new_action["count"] = int(self.count_entry.get())
+            compile_action(len(self.actions), new_action, self.backend) # Reject invalid actions now, not mid-run
+            self.actions.append(new_action); self.sequence_view.inserted(len(self.actions) - 1)
             self.log(f"Added action: {new_action}")
         except ValueError as e: messagebox.showerror("Error", f"Invalid input: {e}")
 
+    def choose_template_image(self):
+        filepath = filedialog.askopenfilename(filetypes=[("Images", "*.png *.bmp *.jpg *.jpeg"), ("All files", "*.*")], title="Image to Find in Area")
+        self.template_image.set(filepath or "")
+
     def remove_action(self):
-        selected_indices = self.listbox.curselection()
-        if selected_indices:
-            removed_action = self.actions.pop(selected_indices[0])
-            self.refresh_listbox()
+        index = self.sequence_view.selected
+        if index is not None:
+            removed_action = self.actions.pop(index)
+            self.sequence_view.removed(index)
             self.log(f"Removed action: {removed_action}")
         else: messagebox.showwarning("Warning", "No action selected to remove.")
 
     def move_up(self):
-        selected_indices = self.listbox.curselection()
-        if selected_indices:
-            index = selected_indices[0]
+        index = self.sequence_view.selected
+        if index is not None:
             if index > 0:
                 self.actions[index], self.actions[index - 1] = self.actions[index - 1], self.actions[index]
-                self.refresh_listbox(); self.listbox.select_set(index - 1)
+                self.sequence_view.swapped(index, index - 1); self.sequence_view.select(index - 1)
                 self.log(f"Moved action up at index {index}")
 
     def move_down(self):
-        selected_indices = self.listbox.curselection()
-        if selected_indices:
-            index = selected_indices[0]
+        index = self.sequence_view.selected
+        if index is not None:
             if index < len(self.actions) - 1:
                 self.actions[index], self.actions[index + 1] = self.actions[index + 1], self.actions[index]
-                self.refresh_listbox(); self.listbox.select_set(index + 1)
+                self.sequence_view.swapped(index, index + 1); self.sequence_view.select(index + 1)
                 self.log(f"Moved action down at index {index}")
 
     def start_key_capture(self):
@@ -302,24 +531,20 @@ class AutoClickerApp:
     def listen_for_key(self, capture_window):
         """Listens for a single key event, updates the UI, and cleans up."""
         hotkey = keyboard.read_hotkey(suppress=False)
-        
+        self.post(self._key_captured, hotkey, capture_window)
+
+    def _key_captured(self, hotkey, capture_window):
         self.captured_key.set(hotkey)
         self.log(f"Captured key: {hotkey}")
-
-        # Re-enable the button and destroy the capture window from the main thread
-        self.root.after(0, self.key_capture_button.config, {"state": "normal", "text": "Capture Key"})
-        self.root.after(0, capture_window.destroy)
+        self.key_capture_button.config(state="normal", text="Capture Key")
+        capture_window.destroy()
 
     def refresh_listbox(self):
-        self.listbox.delete(0, tk.END)
-        for action in self.actions:
-            action_str = f"Type: {action['type']}"
-            if action['type'] in ["Left Click", "Right Click", "Double Click", "Scroll"]:
-                action_str += f" | X={action['x']}, Y={action['y']}"
-                if action['color']: action_str += f", Color={action['color']}"
-                if action['type'] == "Scroll": action_str += f", Amount={action['amount']}"
-            elif action['type'] == "Key Press": action_str += f" | Key='{action['key']}'"
-            self.listbox.insert(tk.END, action_str)
+        self.sequence_view.reset(self.actions)
+
+    @property
+    def running(self):
+        return self.controller.running
 
     def toggle_automation(self):
         if self.running: self.stop_automation()
@@ -331,69 +556,140 @@ class AutoClickerApp:
             if self.time_delay <= 0: raise ValueError("Time delay must be a positive number.")
             self.loop_count = int(self.loop_entry.get())
             if self.loop_count < 0: raise ValueError("Loop count cannot be negative.")
+            self.target_rate = float(self.rate_entry.get() or 0)
+            if self.target_rate < 0: raise ValueError("Target actions per second cannot be negative.")
         except ValueError as e: messagebox.showerror("Error", str(e)); return
+        if self.template_loader: messagebox.showwarning("Warning", "Wait for the template to finish loading."); return
+        if self.recorder: messagebox.showwarning("Warning", "Stop recording before starting the automation."); return
+        if not self.actions: messagebox.showwarning("Warning", "The sequence is empty. Add actions before starting."); return
         if not self.running:
-            self.running = True; self.log("Automation started.")
-            self.automation_thread = threading.Thread(target=self.run_automation_loop); self.automation_thread.start()
+            try: self.plan = self.engine.compile(self.actions, turbo=self.turbo.get(), subroutines=self.subroutines)
+            except TemplateError as e: messagebox.showerror("Error", f"Invalid sequence: {e}"); return
+            if self.plan.merged: self.log(f"Turbo: merged {self.plan.merged} actions into neighbouring input calls.")
+            started = self.controller.submit("start", plan=self.plan, loops=self.loop_count, delay=self.time_delay, rate=self.target_rate,
+                                             stop_on_fail=self.stop_on_fail.get(), frame_ttl=self.frame_ttl.get(), loop_pause=self.loop_pause,
+                                             turbo=self.turbo.get(), speed=self.replay_speed.get(), profile=self.profile_runs.get())
+            started.add_done_callback(lambda f: self.log("Automation started.") if not f.exception() else self.post(self._command_failed, f.exception()))
 
     def stop_automation(self):
         if self.running:
-            self.running = False
-            self.log("Automation stopped.")
-
-    def run_automation_loop(self):
-        loops_completed = 0
-        while self.running:
-            for i, action in enumerate(self.actions):
-                if not self.running: break
-                def highlight_item(index):
-                    self.listbox.selection_clear(0, tk.END)
-                    self.listbox.selection_set(index)
-                    self.listbox.see(index)
-                self.root.after(0, highlight_item, i)
-                if 'color' in action and action['color']:
-                    if pyautogui.pixel(action['x'], action['y']) != action['color']:
-                        self.log(f"Color mismatch at ({action['x']}, {action['y']}).")
-                        if self.stop_on_fail.get():
-                            self.log("Stopping automation due to 'Stop on Fail' being enabled.")
-                            self.running = False
-                            break
-                        else:
-                            self.log("Skipping action due to color mismatch.")
-                            time.sleep(self.time_delay)
-                            continue
-                action_type = action['type']
-                self.log(f"Executing: {action_type} - {action}")
-                if action_type == "Left Click": pyautogui.click(x=action['x'], y=action['y'], button='left')
-                elif action_type == "Right Click": pyautogui.click(x=action['x'], y=action['y'], button='right')
-                elif action_type == "Double Click": pyautogui.doubleClick(x=action['x'], y=action['y'])
-                elif action_type == "Scroll": pyautogui.scroll(action['amount'], x=action['x'], y=action['y'])
-                elif action_type == "Key Press":
-                    keys = action['key'].split('+')
-                    pyautogui.hotkey(*keys)
-                time.sleep(self.time_delay)
-            
-            if not self.running: break
-
-            if self.loop_count > 0:
-                loops_completed += 1
-                self.log(f"Loop {loops_completed}/{self.loop_count} completed.")
-                if loops_completed >= self.loop_count:
-                    self.running = False
+            self.controller.submit("stop").add_done_callback(lambda f: self.log("Automation stopped.") if not f.exception() else self.post(self._command_failed, f.exception()))
+
+    def _command_failed(self, error):
+        messagebox.showerror("Error", str(error))
+
+    def _on_run_finished(self, stats):
+        self.sequence_view.clear_highlight()
+
+    def _snapshot_sequence(self):
+        """The sequence a remote 'start' runs (called from the controller thread), including a remote load the UI has not applied yet."""
+        pending = self.pending_load
+        if pending is not None: return list(pending[0]), dict(self.subroutines, **pending[1])
+        return list(self.actions), dict(self.subroutines)
+
+    def _on_remote_load(self, actions, subroutines, path):
+        self.pending_load = pending = (actions, subroutines)
+        self.post(self._apply_remote_load, pending, path)
+
+    def _apply_remote_load(self, pending, path):
+        actions, subroutines = pending
+        if self.template_loader: self.template_loader.cancel(); self.template_loader = None
+        self.actions = list(actions); self.subroutines.update(subroutines)
+        if self.pending_load is pending: self.pending_load = None
+        self.refresh_listbox()
+        self.log(f"Template loaded through the control API from {path or 'inline actions'} ({len(actions)} actions)")
+
+    def toggle_control_api(self):
+        if self.control_api.get():
+            try: self.control_server = ControlServer(self.controller, DEFAULT_ADDRESS)
+            except (OSError, ValueError) as e:
+                self.control_api.set(False); messagebox.showerror("Error", f"Could not start the control API: {e}"); return
+            self.log(f"Control API listening on {DEFAULT_ADDRESS}")
+        elif self.control_server:
+            self.control_server.close(); self.control_server = None
+            self.log("Control API stopped.")
+
+    def toggle_recording(self, from_button=False):
+        if self.recorder: self.stop_recording(from_button)
+        else: self.start_recording()
+
+    def start_recording(self):
+        if self.running: messagebox.showwarning("Warning", "Stop the automation before recording."); return
+        recorder = Recorder()
+        try: recorder.start()
+        except ImportError as e: messagebox.showerror("Error", str(e)); return
+        self.recorder = recorder
+        self.record_button.config(text="Stop Recording")
+        self.log("Recording mouse and keyboard input. Press Ctrl+R to stop.")
+
+    def stop_recording(self, from_button=False):
+        recorder, self.recorder = self.recorder, None
+        recorder.stop()
+        self.record_button.config(text="Record")
+        recorded = recorder.to_actions(ignore=("ctrl+r",))
+        # The click on "Stop Recording" itself was recorded as well
+        if from_button and recorded and recorded[-1]["type"] == "Left Click": recorded.pop()
+        start = len(self.actions)
+        self.actions.extend(recorded); self.sequence_view.extended(start)
+        self.log(f"Recorded {len(recorder)} input events ({recorder.nbytes / 1024:.1f} KB) as {len(recorded)} actions.")
+
+    def add_triggered_sequence(self, kind):
+        """Adds a copy of the current sequence as a named sequence started by a hotkey, a timer or the condition in the input fields."""
+        if not self.actions: messagebox.showwarning("Warning", "The sequence is empty."); return
+        name = simpledialog.askstring("Triggered Sequence", "Sequence name:", parent=self.root)
+        if not name or not name.strip(): return
+        try:
+            if kind == "hotkey":
+                hotkey = simpledialog.askstring("Triggered Sequence", "Hotkey (e.g. ctrl+shift+1):", initialvalue=self.captured_key.get(), parent=self.root)
+                if not hotkey: return
+                trigger = HotkeyTrigger(hotkey)
+            elif kind == "timer":
+                interval = simpledialog.askfloat("Triggered Sequence", "Run every (seconds):", minvalue=0.05, parent=self.root)
+                if interval is None: return
+                trigger = TimerTrigger(interval)
             else:
-                self.log("Loop completed, starting next iteration.")
-
-            if self.running: time.sleep(0.1)
-
-        self.log("Automation sequence finished.")
-        self.root.after(0, self.listbox.selection_clear, 0, tk.END)
+                condition = {}
+                self._read_condition_fields(condition) # Uses X, Y, color, area and image from the input fields
+                trigger = ScreenTrigger(condition)
+            priority = simpledialog.askinteger("Triggered Sequence", "Priority (higher gets the input first):", initialvalue=0, parent=self.root)
+            if priority is None: return
+            loops = simpledialog.askinteger("Triggered Sequence", "Loops per trigger (0 = until stopped):", initialvalue=1, minvalue=0, parent=self.root)
+            if loops is None: return
+            self.triggers.add(name.strip(), [dict(action) for action in self.actions], trigger, priority=priority, loops=loops,
+                              delay=float(self.time_entry.get()), stop_on_fail=self.stop_on_fail.get(), speed=self.replay_speed.get(),
+                              subroutines=dict(self.subroutines), frame_ttl=self.frame_ttl.get() or None)
+        except ValueError as e: messagebox.showerror("Error", f"Invalid trigger: {e}"); return
+        self.log(f"Added triggered sequence '{name.strip()}' ({trigger}, priority {priority}, {len(self.actions)} actions).")
+
+    def start_triggers(self):
+        if not self.triggers.sequences: messagebox.showwarning("Warning", "No triggered sequences. Add one from the Triggers menu first."); return
+        self.triggers.start()
+
+    def stop_triggers(self):
+        self.triggers.stop()
+
+    def show_trigger_status(self):
+        status = self.triggers.status()
+        if not status: messagebox.showinfo("Triggers", "No triggered sequences."); return
+        lines = [f"Triggers {'active' if self.triggers.active else 'stopped'}", ""]
+        for name, s in status.items():
+            lines.append(f"{name}: {s['trigger']}, priority {s['priority']}, {'running' if s['running'] else 'idle'}, "
+                         f"{s['runs']} run(s), {s['actions']} actions, input wait max {s['lock_wait_max'] * 1000:.1f} ms")
+        messagebox.showinfo("Triggers", "\n".join(lines))
+
+    def clear_triggers(self):
+        for name in list(self.triggers.sequences): self.triggers.remove(name)
+        self.log("Removed all triggered sequences.")
 
     def stop_script(self):
-        self.stop_automation(); self.root.quit()
+        if self.recorder: self.recorder.stop()
+        if self.control_server: self.control_server.close()
+        self.triggers.stop()
+        self.engine.stop(); self.stop_log_file(); self.root.quit()
 
     def activate_color_picker(self):
         try:
-            x, y = pyautogui.position(); color = pyautogui.pixel(x, y)
+            x, y = self.backend.position(); color = self.backend.pixel(x, y)
             if self.action_type.get() not in ["Key Press"]:
                 self.x_entry.delete(0, tk.END); self.x_entry.insert(0, str(x))
                 self.y_entry.delete(0, tk.END); self.y_entry.insert(0, str(y))
@@ -404,21 +700,82 @@ class AutoClickerApp:
         except Exception as e: messagebox.showerror("Error", f"Could not pick color: {e}")
 
     def save_template(self):
-        filepath = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")], title="Save Action Template")
+        filepath = filedialog.asksaveasfilename(defaultextension=".json", filetypes=TEMPLATE_FILETYPES[1:], title="Save Action Template")
         if not filepath: return
         try:
-            with open(filepath, 'w') as f: json.dump(self.actions, f, indent=4)
+            templates.save_template(filepath, self.actions, self.subroutines)
             self.log(f"Template saved to {filepath}")
         except Exception as e: messagebox.showerror("Error", f"Failed to save template: {e}")
 
+    def export_json(self):
+        filepath = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")], title="Export as Plain JSON")
+        if not filepath: return
+        try:
+            templates.export_json(filepath, self.actions)
+            self.log(f"Sequence exported to {filepath}")
+        except Exception as e: messagebox.showerror("Error", f"Failed to export sequence: {e}")
+
     def load_template(self):
-        filepath = filedialog.askopenfilename(filetypes=[("JSON files", "*.json")], title="Load Action Template")
+        filepath = filedialog.askopenfilename(filetypes=TEMPLATE_FILETYPES, title="Load Action Template")
+        if not filepath: return
+        if self.running: messagebox.showwarning("Warning", "Stop the automation before loading a template."); return
+        if self.template_loader: self.template_loader.cancel()
+        # Parsing and validation run on a worker thread; batches are appended from a Tk timer
+        previous = self.actions
+        self.actions = []
+        self.refresh_listbox()
+        self.template_loader = loader = templates.TemplateLoader(filepath)
+        self.root.after(0, self._poll_template_loader, loader, previous)
+
+    def _poll_template_loader(self, loader, previous):
+        if loader is not self.template_loader: return # superseded by another load
+        batches, finished = loader.poll()
+        if batches:
+            start = len(self.actions)
+            for batch in batches: self.actions.extend(batch)
+            self.sequence_view.extended(start)
+        if not finished:
+            self.root.after(15, self._poll_template_loader, loader, previous); return
+        self.template_loader = None
+        if loader.error:
+            self.actions = previous; self.refresh_listbox()
+            messagebox.showerror("Error", f"Failed to load template: {loader.error}"); return
+        self.subroutines.update(loader.subroutines)
+        self.log(f"Template loaded from {loader.path} ({loader.loaded} actions, {len(loader.subroutines)} subroutines)")
+
+    def save_as_subroutine(self):
+        if not self.actions: messagebox.showwarning("Warning", "The sequence is empty."); return
+        name = simpledialog.askstring("Save as Subroutine", "Subroutine name:", parent=self.root)
+        if not name or not name.strip(): return
+        self.subroutines[name.strip()] = [dict(action) for action in self.actions]
+        self.log(f"Saved current sequence as subroutine '{name.strip()}' ({len(self.actions)} actions).")
+
+    def load_subroutines(self):
+        filepath = filedialog.askopenfilename(filetypes=[("JSON files", "*.json")], title="Load Subroutine Library")
+        if not filepath: return
+        try:
+            library = templates.load_library(filepath)
+            self.subroutines.update(library)
+            self.log(f"Loaded {len(library)} subroutines from {filepath}")
+        except Exception as e: messagebox.showerror("Error", f"Failed to load subroutines: {e}")
+
+    def save_subroutines(self):
+        filepath = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")], title="Save Subroutine Library")
+        if not filepath: return
+        try:
+            templates.save_library(filepath, self.subroutines)
+            self.log(f"Subroutine library saved to {filepath}")
+        except Exception as e: messagebox.showerror("Error", f"Failed to save subroutines: {e}")
+
+    def export_profile(self):
+        profile = self.engine.profile
+        if profile is None: messagebox.showwarning("Warning", "No profiled run yet. Enable Options > Profile Runs and run the sequence."); return
+        filepath = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json"), ("CSV files", "*.csv")], title="Export Run Profile")
         if not filepath: return
         try:
-            with open(filepath, 'r') as f: self.actions = json.load(f)
-            self.refresh_listbox()
-            self.log(f"Template loaded from {filepath}")
-        except Exception as e: messagebox.showerror("Error", f"Failed to load template: {e}")
+            profile.export(filepath)
+            self.log(f"Run profile exported to {filepath}")
+        except Exception as e: messagebox.showerror("Error", f"Failed to export profile: {e}")
 
     def save_log(self):
         filepath = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text files", "*.txt")], title="Save Log")
@@ -0,0 +1,225 @@
+"""
+Input and screen backends.
+
+The engine and the UI never call `pyautogui` directly; they go through a
+`Backend`. `PyAutoGuiBackend` drives the real desktop, `FakeBackend` simulates
+a framebuffer in memory and records every input event, so sequences can be run
+and benchmarked on machines without a display.
+"""
+import time
+
+
+class Backend:
+    """Mouse, keyboard and screen access used by the engine."""
+    name = "base"
+
+    def position(self):
+        """Returns the current (x, y) mouse position."""
+        raise NotImplementedError
+
+    def size(self):
+        """Returns the (width, height) of the screen."""
+        raise NotImplementedError
+
+    def configure(self, pause=None, failsafe=None):
+        """
+        Sets the pause applied after each input call and the corner fail-safe.
+
+        Arguments left as None are unchanged. Returns the previous settings
+        as keyword arguments that can be passed back to restore them.
+        """
+        return {}
+
+    def screenshot(self, region=None):
+        """Captures `region` (left, top, width, height), or the whole screen, as an image with `getpixel`."""
+        raise NotImplementedError
+
+    def pixel(self, x, y):
+        """Returns the (r, g, b) color at (x, y)."""
+        return tuple(self.screenshot((x, y, 1, 1)).getpixel((0, 0))[:3])
+
+    def click(self, x, y, button='left', clicks=1):
+        raise NotImplementedError
+
+    def double_click(self, x, y):
+        raise NotImplementedError
+
+    def scroll(self, amount, x, y):
+        raise NotImplementedError
+
+    def move(self, x, y):
+        """Moves the mouse to (x, y) without clicking."""
+        raise NotImplementedError
+
+    def hotkey(self, *keys):
+        raise NotImplementedError
+
+    def write(self, text):
+        """Types `text` as a sequence of key presses."""
+        raise NotImplementedError
+
+
+class PyAutoGuiBackend(Backend):
+    """Drives the real mouse, keyboard and screen through pyautogui."""
+    name = "pyautogui"
+
+    def __init__(self):
+        import pyautogui
+        self.pyautogui = pyautogui
+
+    def position(self):
+        x, y = self.pyautogui.position()
+        return x, y
+
+    def size(self):
+        width, height = self.pyautogui.size()
+        return width, height
+
+    def configure(self, pause=None, failsafe=None):
+        previous = {"pause": self.pyautogui.PAUSE, "failsafe": self.pyautogui.FAILSAFE}
+        if pause is not None: self.pyautogui.PAUSE = pause
+        if failsafe is not None: self.pyautogui.FAILSAFE = failsafe
+        return previous
+
+    def screenshot(self, region=None):
+        return self.pyautogui.screenshot(region=region)
+
+    def click(self, x, y, button='left', clicks=1):
+        self.pyautogui.click(x=x, y=y, button=button, clicks=clicks)
+
+    def double_click(self, x, y):
+        self.pyautogui.doubleClick(x=x, y=y)
+
+    def scroll(self, amount, x, y):
+        self.pyautogui.scroll(amount, x=x, y=y)
+
+    def move(self, x, y):
+        self.pyautogui.moveTo(x, y)
+
+    def hotkey(self, *keys):
+        self.pyautogui.hotkey(*keys)
+
+    def write(self, text):
+        self.pyautogui.write(text)
+
+
+class FakeImage:
+    """A region copied out of a `FakeBackend` framebuffer."""
+    __slots__ = ("width", "height", "data")
+
+    def __init__(self, width, height, data):
+        self.width = width
+        self.height = height
+        self.data = data
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    def getpixel(self, xy):
+        offset = (xy[1] * self.width + xy[0]) * 3
+        return tuple(self.data[offset:offset + 3])
+
+    def __array__(self, dtype=None, copy=None):
+        import numpy
+        array = numpy.frombuffer(self.data, dtype=numpy.uint8).reshape(self.height, self.width, 3)
+        return array if dtype is None else array.astype(dtype)
+
+
+class FakeBackend(Backend):
+    """
+    An in-memory backend for headless runs and benchmarks.
+
+    The screen is a `width` x `height` RGB framebuffer that can be painted with
+    `set_pixel`/`fill`. Every input call is appended to `events` as
+    `(timestamp, kind, args)`, with `time.perf_counter` timestamps. `latency`
+    simulates the cost of a real input call in seconds, on top of the
+    configured `pause`.
+    """
+    name = "fake"
+
+    def __init__(self, width=1920, height=1080, color=(0, 0, 0), latency=0.0):
+        self.width = width
+        self.height = height
+        self.framebuffer = bytearray(bytes(color) * (width * height))
+        self.latency = latency
+        self.cursor = (width // 2, height // 2)
+        self.events = []
+        self.pause = 0.0
+        self.failsafe = True
+
+    # --- Framebuffer ---
+    def set_pixel(self, x, y, color):
+        offset = (y * self.width + x) * 3
+        self.framebuffer[offset:offset + 3] = bytes(color)
+
+    def fill(self, color, region=None):
+        left, top, width, height = region or (0, 0, self.width, self.height)
+        row = bytes(color) * width
+        for y in range(top, top + height):
+            offset = (y * self.width + left) * 3
+            self.framebuffer[offset:offset + len(row)] = row
+
+    def screenshot(self, region=None):
+        left, top, width, height = region or (0, 0, self.width, self.height)
+        if left < 0 or top < 0 or left + width > self.width or top + height > self.height:
+            raise ValueError(f"Region {region} is outside the {self.width}x{self.height} screen")
+        stride = self.width * 3
+        if left == 0 and width == self.width:
+            data = bytes(self.framebuffer[top * stride:(top + height) * stride])
+        else:
+            data = b"".join(self.framebuffer[y * stride + left * 3:y * stride + (left + width) * 3] for y in range(top, top + height))
+        return FakeImage(width, height, data)
+
+    def pixel(self, x, y):
+        offset = (y * self.width + x) * 3
+        return tuple(self.framebuffer[offset:offset + 3])
+
+    # --- Input ---
+    def _record(self, kind, *args):
+        self.events.append((time.perf_counter(), kind, args))
+        if self.latency or self.pause: time.sleep(self.latency + self.pause)
+
+    def position(self):
+        return self.cursor
+
+    def size(self):
+        return self.width, self.height
+
+    def configure(self, pause=None, failsafe=None):
+        previous = {"pause": self.pause, "failsafe": self.failsafe}
+        if pause is not None: self.pause = pause
+        if failsafe is not None: self.failsafe = failsafe
+        return previous
+
+    def click(self, x, y, button='left', clicks=1):
+        self.cursor = (x, y)
+        self._record("click", x, y, button, clicks)
+
+    def double_click(self, x, y):
+        self.cursor = (x, y)
+        self._record("double_click", x, y)
+
+    def scroll(self, amount, x, y):
+        self.cursor = (x, y)
+        self._record("scroll", amount, x, y)
+
+    def move(self, x, y):
+        self.cursor = (x, y)
+        self._record("move", x, y)
+
+    def hotkey(self, *keys):
+        self._record("hotkey", *keys)
+
+    def write(self, text):
+        self._record("write", text)
+
+    def clear_events(self):
+        self.events.clear()
+
+
+def create_backend(name="pyautogui", **kwargs):
+    """Returns a backend by name ('pyautogui' or 'fake')."""
+    if name == "pyautogui": return PyAutoGuiBackend(**kwargs)
+    if name == "fake": return FakeBackend(**kwargs)
+    raise ValueError(f"Unknown backend: {name}")
@@ -0,0 +1,128 @@
+"""
+Headless benchmarks for the automation engine.
+
+Runs representative templates on the in-memory `FakeBackend` and reports
+throughput, per-action latency and scheduling jitter, so regressions in the
+hot loop show up as numbers. No display is needed:
+
+    python benchmark.py --loops 2000
+"""
+import argparse
+import statistics
+import sys
+
+from backends import FakeBackend
+from engine import Engine
+
+RED, GREEN = (255, 0, 0), (0, 255, 0)
+
+
+def _clicks(n):
+    return [{"type": "Left Click", "x": 10 + i, "y": 20, "color": None} for i in range(n)]
+
+
+def _color_gated(n):
+    return [{"type": "Left Click", "x": 10 + i, "y": 20, "color": RED} for i in range(n)]
+
+
+def _keys(n):
+    return [{"type": "Key Press", "key": "ctrl+shift+a" if i % 2 else "a"} for i in range(n)]
+
+
+def _mixed(n):
+    kinds = [
+        lambda i: {"type": "Left Click", "x": 100 + i, "y": 100, "color": RED},
+        lambda i: {"type": "Right Click", "x": 200, "y": 100 + i, "color": None},
+        lambda i: {"type": "Double Click", "x": 300, "y": 300, "color": GREEN},
+        lambda i: {"type": "Scroll", "x": 400, "y": 400, "color": None, "amount": -3},
+        lambda i: {"type": "Key Press", "key": "ctrl+c"},
+    ]
+    return [kinds[i % len(kinds)](i) for i in range(n)]
+
+
+def _repeat_block(n):
+    body = [{"type": "Left Click", "x": 10, "y": 20, "color": RED}, {"type": "Key Press", "key": "a"}]
+    return [{"type": "Repeat", "count": max(1, n // len(body))}] + body + [{"type": "End Repeat"}]
+
+
+TEMPLATES = {
+    "clicks": _clicks,
+    "color-gated": _color_gated,
+    "keys": _keys,
+    "mixed": _mixed,
+    "repeat-block": _repeat_block,
+}
+
+
+def make_backend():
+    """Returns a fake screen painted so every color condition in TEMPLATES matches."""
+    backend = FakeBackend(width=800, height=600)
+    backend.fill(RED, (0, 0, 800, 100))
+    backend.set_pixel(300, 300, GREEN)
+    return backend
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def bench_throughput(name, actions, loops):
+    """Runs `actions` unpaced and measures actions/sec and the gap between consecutive input events."""
+    backend = make_backend()
+    engine = Engine(backend)
+    plan = engine.compile(actions)
+    stats = engine.run(plan, loops=loops, delay=0, loop_pause=0)
+    times = [event[0] for event in backend.events]
+    gaps = sorted(b - a for a, b in zip(times, times[1:])) or [0.0]
+    return {
+        "template": name,
+        "actions": stats["ticks"],
+        "rate": stats["rate"],
+        "latency_mean_us": statistics.fmean(gaps) * 1e6,
+        "latency_p50_us": _percentile(gaps, 0.50) * 1e6,
+        "latency_p99_us": _percentile(gaps, 0.99) * 1e6,
+        "capture_misses": stats["capture"]["misses"],
+    }
+
+
+def bench_jitter(name, actions, size, rate, seconds):
+    """Runs `actions` (`size` input actions per pass) paced at `rate` actions/sec for about `seconds` and measures wake-up jitter."""
+    backend = make_backend()
+    engine = Engine(backend)
+    plan = engine.compile(actions)
+    loops = max(1, int(rate * seconds / size))
+    stats = engine.run(plan, loops=loops, target_rate=rate)
+    return {
+        "template": name,
+        "target": rate,
+        "rate": stats["rate"],
+        "jitter_us": stats["jitter"] * 1e6,
+        "max_late_us": stats["max_lateness"] * 1e6,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the automation engine on the fake backend.")
+    parser.add_argument("--size", type=int, default=50, help="Actions per template (default: 50)")
+    parser.add_argument("--loops", type=int, default=200, help="Passes per throughput run (default: 200)")
+    parser.add_argument("--rate", type=float, default=1000.0, help="Target actions/sec for the jitter run (default: 1000)")
+    parser.add_argument("--seconds", type=float, default=1.0, help="Duration of each jitter run (default: 1.0)")
+    parser.add_argument("--template", choices=sorted(TEMPLATES), action="append", help="Only run the given template(s)")
+    args = parser.parse_args(argv)
+    names = args.template or list(TEMPLATES)
+
+    print(f"{'template':<12} {'actions':>8} {'actions/s':>11} {'mean us':>9} {'p50 us':>9} {'p99 us':>9} {'captures':>9}")
+    for name in names:
+        r = bench_throughput(name, TEMPLATES[name](args.size), args.loops)
+        print(f"{r['template']:<12} {r['actions']:>8} {r['rate']:>11.0f} {r['latency_mean_us']:>9.2f} {r['latency_p50_us']:>9.2f} {r['latency_p99_us']:>9.2f} {r['capture_misses']:>9}")
+
+    print()
+    print(f"{'template':<12} {'target/s':>9} {'actual/s':>9} {'jitter us':>10} {'max late us':>12}")
+    for name in names:
+        r = bench_jitter(name, TEMPLATES[name](args.size), args.size, args.rate, args.seconds)
+        print(f"{r['template']:<12} {r['target']:>9.0f} {r['rate']:>9.1f} {r['jitter_us']:>10.1f} {r['max_late_us']:>12.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
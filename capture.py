@@ -0,0 +1,95 @@
+"""
+Frame-cached screen capture used by color conditions.
+
+`pyautogui.pixel` grabs the whole screen to read a single pixel. `FrameCache`
+instead grabs only the bounding box of the points and regions a sequence
+checks, keeps that frame for one pass (or until its TTL expires) and serves
+every pixel and region lookup of the pass from it.
+"""
+import time
+
+
+def _default_grab(region):
+    import pyautogui
+    return pyautogui.screenshot(region=region)
+
+
+class FrameCache:
+    """
+    Serves pixel lookups from a single cached capture of the watched region.
+
+    `ttl` is the maximum age of a frame in seconds (None keeps it until
+    `invalidate` is called). `grab` is a callable taking a
+    (left, top, width, height) region and returning an image with `getpixel`.
+    """
+    def __init__(self, ttl=0.1, grab=None):
+        self.ttl = ttl
+        self._grab = grab or _default_grab
+        self.region = None
+        self._frame = None
+        self._frame_array = None
+        self._frame_time = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def watch(self, regions):
+        """Sets the capture region to the bounding box of the given (left, top, width, height) regions."""
+        regions = list(regions)
+        if not regions:
+            self.region = None
+        else:
+            left = min(r[0] for r in regions); top = min(r[1] for r in regions)
+            right = max(r[0] + r[2] for r in regions); bottom = max(r[1] + r[3] for r in regions)
+            self.region = (left, top, right - left, bottom - top)
+        self.invalidate()
+
+    def invalidate(self):
+        """Drops the current frame so the next lookup captures a fresh one."""
+        self._frame = None
+        self._frame_array = None
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def _contains(self, left, top, width=1, height=1):
+        r_left, r_top, r_width, r_height = self.region
+        return r_left <= left and r_top <= top and left + width <= r_left + r_width and top + height <= r_top + r_height
+
+    def _current_frame(self):
+        now = time.monotonic()
+        if self._frame is None or (self.ttl is not None and now - self._frame_time > self.ttl):
+            self.misses += 1
+            self._frame = self._grab(self.region)
+            self._frame_array = None
+            self._frame_time = now
+        else:
+            self.hits += 1
+        return self._frame
+
+    def pixel(self, x, y):
+        """Returns the (r, g, b) color at screen coordinates (x, y)."""
+        if self.region is None or not self._contains(x, y):
+            # Outside the watched area: grab just this pixel, keep the frame.
+            self.misses += 1
+            return tuple(self._grab((x, y, 1, 1)).getpixel((0, 0))[:3])
+        frame = self._current_frame()
+        return tuple(frame.getpixel((x - self.region[0], y - self.region[1]))[:3])
+
+    def region_array(self, region):
+        """Returns `region` (left, top, width, height) as an (H, W, 3) NumPy array."""
+        from matching import to_array
+        left, top, width, height = region
+        if self.region is None or not self._contains(left, top, width, height):
+            self.misses += 1
+            return to_array(self._grab(region))
+        frame = self._current_frame()
+        if self._frame_array is None:
+            self._frame_array = to_array(frame)
+        x, y = left - self.region[0], top - self.region[1]
+        return self._frame_array[y:y + height, x:x + width]
+
+    def stats(self):
+        """Returns hit/miss counters for the lookups served since the last reset."""
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
@@ -0,0 +1,155 @@
+"""
+Headless command-line runner.
+
+Loads a template, runs it and prints a summary without creating any Tk
+objects, so templates can be replayed from cron, a task scheduler or a
+script. Only the engine is imported up front; the input backend (pyautogui)
+is imported when the run starts, and the template loader and JSON output only
+when they are needed:
+
+    python cli.py my_template.json --loops 10 --delay 0.5
+    python cli.py recorded.jsonl --speed 2 --json
+    python cli.py --serve 127.0.0.1:8765 --backend fake
+
+With `--serve` nothing runs on its own: the process keeps a control API open
+(see `control.py`) until interrupted, with the template, if given, preloaded.
+"""
+import argparse
+import math
+import sys
+import threading
+
+from logbuffer import DEBUG, INFO, WARNING
+
+EXIT_OK, EXIT_FAILED, EXIT_INVALID, EXIT_INTERRUPTED = 0, 1, 2, 130
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run a Clicker template without the GUI.")
+    parser.add_argument("template", nargs="?", help="Template file (.json or .jsonl)")
+    parser.add_argument("--loops", type=int, default=1, help="Passes to run, 0 = until interrupted (default: 1)")
+    parser.add_argument("--delay", type=float, default=1.0, help="Seconds between actions (default: 1.0)")
+    parser.add_argument("--rate", type=float, default=0.0, help="Target actions per second; replaces --delay (default: off)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed for recorded delays, 0 = ignore them (default: 1.0)")
+    parser.add_argument("--turbo", action="store_true", help="No per-call input pause; merge repeated keys and clicks")
+    parser.add_argument("--stop-on-fail", action="store_true", help="Stop at the first failed condition or timed-out wait")
+    parser.add_argument("--library", action="append", default=[], metavar="FILE", help="Subroutine library to load (repeatable)")
+    parser.add_argument("--backend", choices=("pyautogui", "fake"), default="pyautogui", help="Input backend (default: pyautogui)")
+    parser.add_argument("--profile", metavar="FILE", help="Export the run profile to FILE (.json or .csv)")
+    parser.add_argument("--json", action="store_true", help="Print the run statistics as JSON")
+    parser.add_argument("--serve", nargs="?", const="127.0.0.1:8765", metavar="ADDRESS",
+                        help="Serve the control API on a loopback host:port or a Unix socket path instead of running (default: 127.0.0.1:8765)")
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument("-v", "--verbose", action="store_true", help="Log every executed action")
+    verbosity.add_argument("-q", "--quiet", action="store_true", help="Only log warnings")
+    return parser
+
+
+def _stderr_log(threshold):
+    def log(message, level=INFO):
+        if level >= threshold: print(message, file=sys.stderr)
+    return log
+
+
+def _finite(value):
+    """Makes run statistics JSON-safe (an unpaced run has an infinite target rate)."""
+    if isinstance(value, dict): return {k: _finite(v) for k, v in value.items()}
+    if isinstance(value, float) and not math.isfinite(value): return None
+    return value
+
+
+def format_summary(stats):
+    lines = [f"{stats['loops']} loop(s), {stats['ticks']} actions in {stats['elapsed']:.2f}s ({stats['rate']:.1f}/s), jitter {stats['jitter'] * 1000:.2f} ms"]
+    capture, waits = stats["capture"], stats["waits"]
+    if capture["hits"] or capture["misses"]:
+        lines.append(f"color checks: {capture['hits'] + capture['misses']} lookups, {capture['misses']} captures")
+    if waits["count"]:
+        lines.append(f"waits: {waits['count']} ({waits['timeouts']} timed out), {waits['total']:.2f}s total")
+    return "\n".join(lines)
+
+
+def serve(args, engine, actions, subroutines):
+    """Runs the control API until interrupted."""
+    from control import Controller, ControlServer
+    controller = Controller(engine)
+    if args.template:
+        controller.call("load", actions=actions, subroutines=subroutines)
+        controller.template = args.template
+    try:
+        server = ControlServer(controller, args.serve)
+    except (OSError, ValueError) as e:
+        print(f"error: cannot serve on {args.serve}: {e}", file=sys.stderr)
+        return EXIT_INVALID
+    print(f"Control API listening on {args.serve}. Press Ctrl+C to exit.", file=sys.stderr)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        controller.shutdown()
+    return EXIT_OK
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.template is None and args.serve is None:
+        parser.error("a template is required unless --serve is given")
+    if args.loops < 0 or args.delay <= 0 or args.rate < 0 or args.speed < 0:
+        print("error: --loops, --rate and --speed cannot be negative and --delay must be positive", file=sys.stderr)
+        return EXIT_INVALID
+
+    import templates
+    from backends import create_backend
+    from engine import Engine, TemplateError
+    try:
+        actions, subroutines = templates.load_template(args.template) if args.template else ([], {})
+        for library in args.library: subroutines.update(templates.load_library(library))
+    except (OSError, templates.TemplateFormatError) as e:
+        print(f"error: cannot load template: {e}", file=sys.stderr)
+        return EXIT_INVALID
+
+    log = _stderr_log(DEBUG if args.verbose else WARNING if args.quiet else INFO)
+    engine = Engine(create_backend(args.backend), log=log)
+    if args.serve is not None:
+        return serve(args, engine, actions, subroutines)
+    try:
+        plan = engine.compile(actions, turbo=args.turbo, subroutines=subroutines)
+    except TemplateError as e:
+        print(f"error: invalid template: {e}", file=sys.stderr)
+        return EXIT_INVALID
+
+    # Run on a worker thread so Ctrl+C stops the engine cleanly and still reports
+    result = {}
+    def run():
+        result["stats"] = engine.run(plan, loops=args.loops, delay=args.delay, target_rate=args.rate, stop_on_fail=args.stop_on_fail,
+                                     turbo=args.turbo, time_scale=1 / args.speed if args.speed else None, profile=bool(args.profile))
+    worker = threading.Thread(target=run, name="engine")
+    interrupted = False
+    worker.start()
+    while worker.is_alive():
+        try:
+            worker.join(0.1)
+        except KeyboardInterrupt:
+            interrupted = True
+            engine.stop()
+    stats = result.get("stats")
+    if stats is None:
+        return EXIT_FAILED # The run raised; the traceback was printed by the thread
+
+    if args.profile:
+        try: engine.profile.export(args.profile)
+        except OSError as e: print(f"error: cannot write profile: {e}", file=sys.stderr)
+    if args.json:
+        import json
+        print(json.dumps(_finite(stats), indent=2))
+    else:
+        print(format_summary(stats))
+    if interrupted: return EXIT_INTERRUPTED
+    completed = args.loops == 0 or stats["loops"] >= args.loops
+    return EXIT_OK if completed else EXIT_FAILED
+
+
+if __name__ == "__main__":
+    sys.exit(main())
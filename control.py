@@ -0,0 +1,258 @@
+"""
+Serialized control of the engine.
+
+Hotkeys, the GUI and remote clients all used to start and stop runs from
+their own threads. `Controller` puts every command (load, start, stop,
+status, stats) on one queue and executes them in order on a single
+controller thread, so two runs can never overlap: a stop waits for the run
+thread to finish, and a start is refused while one is still alive.
+
+`ControlServer` exposes the same commands over a local socket, either TCP on
+a loopback address ('127.0.0.1:8765') or a Unix socket path, using one JSON
+object per line:
+
+    -> {"cmd": "load", "path": "farm.json"}
+    <- {"ok": true, "result": {"actions": 12, "subroutines": 1}}
+    -> {"cmd": "start", "loops": 5, "rate": 20}
+    <- {"ok": true, "result": {"running": true, ...}}
+"""
+import json
+import math
+import os
+import queue
+import socket
+import socketserver
+import stat
+import threading
+import time
+from concurrent.futures import Future
+
+from logbuffer import ERROR
+
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+
+# Run options accepted by 'start', with their defaults
+RUN_OPTIONS = {
+    "loops": 1, "delay": 1.0, "rate": 0.0, "stop_on_fail": False,
+    "turbo": False, "speed": 1.0, "frame_ttl": 0.1, "loop_pause": 0.1, "profile": False,
+}
+
+
+class ControlError(Exception):
+    """A command was rejected; the message is returned to the caller."""
+
+
+def check_options(options):
+    """Raises ControlError unless every run option is known and has a usable type and range."""
+    unknown = set(options) - set(RUN_OPTIONS)
+    if unknown: raise ControlError(f"unknown run option(s): {', '.join(sorted(unknown))}")
+    for name, value in options.items():
+        if isinstance(RUN_OPTIONS[name], bool):
+            if not isinstance(value, bool): raise ControlError(f"'{name}' must be true or false")
+            continue
+        if name == "loops":
+            if not isinstance(value, int) or isinstance(value, bool) or value < 0: raise ControlError("'loops' must be a whole number, 0 or more")
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ControlError(f"'{name}' must be a number")
+        if name == "delay" and value <= 0: raise ControlError("'delay' must be positive")
+        if value < 0: raise ControlError(f"'{name}' cannot be negative")
+
+
+def _json_safe(value):
+    if isinstance(value, dict): return {str(k): _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)): return [_json_safe(v) for v in value]
+    if isinstance(value, float) and not math.isfinite(value): return None
+    return value
+
+
+class Controller:
+    """
+    Owns the command queue and the run thread of `engine`.
+
+    `source`, if given, returns the (actions, subroutines) that 'start' runs
+    when no plan is passed; otherwise the last loaded template is used.
+    `on_loaded(actions, subroutines, path)` and `on_finished(stats)` are
+    called from the controller and run threads respectively; `stats` is
+    None if the run raised.
+    """
+    def __init__(self, engine, source=None, on_loaded=None, on_finished=None, stop_timeout=5.0):
+        self.engine = engine
+        self.source = source
+        self.on_loaded = on_loaded
+        self.on_finished = on_finished
+        self.stop_timeout = stop_timeout
+        self.actions = []
+        self.subroutines = {}
+        self.template = None
+        self.options = {}
+        self._commands = queue.Queue()
+        self._run_thread = None
+        self._thread = threading.Thread(target=self._serve, name="controller", daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self):
+        return self._run_thread is not None and self._run_thread.is_alive()
+
+    def submit(self, command, **args):
+        """Queues `command` and returns a Future with its result."""
+        future = Future()
+        self._commands.put((command, args, future))
+        return future
+
+    def call(self, command, timeout=None, **args):
+        """Queues `command` and waits for its result."""
+        return self.submit(command, **args).result(timeout)
+
+    def shutdown(self):
+        """Stops any run and ends the controller thread."""
+        self.call("stop")
+        self._commands.put(None)
+        self._thread.join()
+
+    def _serve(self):
+        while True:
+            item = self._commands.get()
+            if item is None: return
+            command, args, future = item
+            if not future.set_running_or_notify_cancel(): continue
+            handler = getattr(self, f"_cmd_{command}", None)
+            try:
+                if handler is None: raise ControlError(f"unknown command {command!r}")
+                future.set_result(handler(**args))
+            except Exception as e:
+                future.set_exception(e)
+
+    # --- Commands (run on the controller thread) ---
+    def _cmd_load(self, path=None, actions=None, subroutines=None):
+        """Loads a template file, or an action list and subroutines sent inline."""
+        import templates
+        if path is not None:
+            if not isinstance(path, str): raise ControlError("'path' must be a string")
+            actions, subroutines = templates.load_template(path)
+        elif actions is not None:
+            if not isinstance(subroutines, (dict, type(None))): raise ControlError("'subroutines' must map names to action lists")
+            actions = templates.normalize_actions(actions)
+            subroutines = {name: templates.normalize_actions(body) for name, body in (subroutines or {}).items()}
+        else:
+            raise ControlError("'load' needs a 'path' or 'actions'")
+        if self.running: raise ControlError("cannot load while a run is in progress")
+        self.actions, self.subroutines, self.template = actions, subroutines, path
+        if self.on_loaded: self.on_loaded(actions, subroutines, path)
+        return {"actions": len(actions), "subroutines": len(subroutines)}
+
+    def _cmd_start(self, plan=None, **options):
+        check_options(options)
+        if self.running: raise ControlError("a run is already in progress")
+        if self._run_thread is not None: self._run_thread.join() # Finished; reap it
+        options = dict(RUN_OPTIONS, **options)
+        if plan is None:
+            actions, subroutines = self.source() if self.source else (self.actions, self.subroutines)
+            if not actions: raise ControlError("no template loaded")
+            plan = self.engine.compile(actions, turbo=options["turbo"], subroutines=subroutines)
+        self.options = options
+        self.engine.running = True # Reported as running before the thread gets going
+        self._run_thread = threading.Thread(target=self._run, args=(plan, options), name="engine", daemon=True)
+        self._run_thread.start()
+        return self._cmd_status()
+
+    def _run(self, plan, options):
+        speed = options["speed"]
+        stats = None
+        try:
+            stats = self.engine.run(plan, loops=options["loops"], delay=options["delay"], target_rate=options["rate"],
+                                    stop_on_fail=options["stop_on_fail"], frame_ttl=options["frame_ttl"] or None, loop_pause=options["loop_pause"],
+                                    turbo=options["turbo"], time_scale=1 / speed if speed else None, profile=options["profile"])
+        except Exception as e: # e.g. the pyautogui fail-safe or a failed screenshot
+            self.engine.running = False
+            self.engine.log(f"Run failed: {e!r}", ERROR)
+        finally:
+            if self.on_finished: self.on_finished(stats)
+
+    def _cmd_stop(self):
+        """Stops the run and waits for its thread to exit."""
+        thread = self._run_thread
+        deadline = time.monotonic() + self.stop_timeout
+        # Repeat the stop: a run thread that has not reached `Engine.run` yet would set `running` again
+        while thread is not None and thread.is_alive():
+            self.engine.stop()
+            thread.join(0.05)
+            if time.monotonic() > deadline: raise ControlError(f"the run did not stop within {self.stop_timeout:g}s")
+        return self._cmd_status()
+
+    def _cmd_status(self):
+        return {
+            "running": self.running, "template": self.template, "actions": len(self.actions),
+            "loops_completed": self.engine.loops_completed, "options": self.options,
+        }
+
+    def _cmd_stats(self):
+        """Statistics of the last finished run, plus live profile phases if the current run is profiled."""
+        stats = dict(self.engine.last_stats)
+        if self.running and self.engine.profile is not None: stats["profile"] = self.engine.profile.phases()
+        return _json_safe(stats)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        controller = self.server.controller
+        for line in self.rfile:
+            if not line.strip(): continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict) or not isinstance(request.get("cmd"), str):
+                    raise ControlError("expected an object with a 'cmd' string")
+                args = {k: v for k, v in request.items() if k != "cmd"}
+                if "plan" in args: raise ControlError("'plan' cannot be sent remotely")
+                response = {"ok": True, "result": _json_safe(controller.call(request["cmd"], **args))}
+            except TypeError as e:
+                response = {"ok": False, "error": f"bad arguments: {e}"}
+            except (ValueError, OSError, ControlError) as e: # JSON, template and file errors
+                response = {"ok": False, "error": str(e)}
+            self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+class ControlServer:
+    """
+    Serves `controller` on `address`: 'host:port' on a loopback interface,
+    or a filesystem path for a Unix socket (created with owner-only access).
+    """
+    def __init__(self, controller, address=DEFAULT_ADDRESS):
+        self.address = address
+        host, sep, port = address.rpartition(":")
+        if sep and port.isdigit():
+            if host not in ("127.0.0.1", "localhost", "::1"):
+                raise ValueError(f"the control API only listens on loopback addresses, not {host!r}")
+            self.server = _TCPServer((host, int(port)), _Handler)
+            self.path = None
+        else:
+            if not hasattr(socket, "AF_UNIX"): raise ValueError("Unix sockets are not supported on this platform; use host:port")
+            if os.path.lexists(address):
+                if not stat.S_ISSOCK(os.lstat(address).st_mode): raise ValueError(f"{address} exists and is not a socket")
+                os.unlink(address) # Left over from a previous run
+            previous = os.umask(0o177) # Owner-only from the moment it is bound
+            try:
+                self.server = _UnixServer(address, _Handler)
+            finally:
+                os.umask(previous)
+            self.path = address
+        self.server.controller = controller
+        self._thread = threading.Thread(target=self.server.serve_forever, name="control-server", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.path and os.path.lexists(self.path) and stat.S_ISSOCK(os.lstat(self.path).st_mode): os.unlink(self.path)
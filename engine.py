@@ -0,0 +1,787 @@
+"""
+Compiles an action sequence into a prevalidated execution plan.
+
+The GUI stores actions as plain dicts. Interpreting those on every pass means
+string comparisons on the type, re-splitting key combos and re-checking for a
+color condition per action. `compile_actions` does all of that once when a run
+starts and returns slotted `Instruction` objects with a pre-bound input call,
+so the run loop only has to dispatch.
+
+Control flow (labels, jumps, repeat blocks and subroutine calls) is linked
+into the same flat instruction list and executed with an instruction pointer,
+repeat counters and a call stack, so nothing is expanded and memory stays
+proportional to the template size.
+
+Recorded sequences (see `recorder.py`) carry a per-action `delay`, the gap
+before the action in the recording; runs pace those actions by it, scaled by
+`time_scale`, instead of by the fixed delay or rate.
+
+`Engine` runs a compiled plan against a backend (see `backends.py`) and does
+not depend on Tk, so the same loop drives the GUI, headless runs and the
+benchmarks.
+"""
+import os
+import threading
+import time
+from functools import partial
+
+from capture import FrameCache
+from logbuffer import DEBUG, INFO, WARNING
+from matching import pixel_matches, require_numpy
+from profiler import RunProfile
+from scheduler import Scheduler
+
+MOUSE_ACTIONS = ("Left Click", "Right Click", "Double Click", "Scroll", "Move")
+KEY_ACTIONS = ("Key Press",)
+WAIT_ACTIONS = ("Wait For",)
+FLOW_ACTIONS = ("Label", "Jump", "Repeat", "End Repeat", "Call")
+ACTION_TYPES = MOUSE_ACTIONS + KEY_ACTIONS + WAIT_ACTIONS + FLOW_ACTIONS
+
+# Instruction opcodes
+OP_ACT, OP_WAIT, OP_JUMP, OP_REPEAT, OP_END_REPEAT, OP_CALL, OP_RETURN, OP_END = range(8)
+# Placeholder for a label; removed when the plan is linked
+_OP_LABEL = -1
+
+MAX_CALL_DEPTH = 64
+
+DEFAULT_WAIT_TIMEOUT = 10.0
+# Seconds between fail-safe corner checks in turbo mode, however short the waits between actions are
+EMERGENCY_CHECK_INTERVAL = 0.025
+# Pause after a pass that paced no action (e.g. an empty plan), so rate mode without a loop pause doesn't spin
+IDLE_PASS_PAUSE = 0.1
+
+
+class TemplateError(ValueError):
+    """Raised when an action sequence cannot be compiled."""
+
+
+class PixelCondition:
+    """The pixel at (x, y) is within `tolerance` of `color`."""
+    __slots__ = ("x", "y", "color", "tolerance", "region")
+
+    def __init__(self, x, y, color, tolerance=0):
+        self.x, self.y, self.color, self.tolerance = x, y, color, tolerance
+        self.region = (x, y, 1, 1)
+
+    def test(self, capture):
+        return pixel_matches(capture.pixel(self.x, self.y), self.color, self.tolerance)
+
+    def __str__(self):
+        return f"Color mismatch at ({self.x}, {self.y})."
+
+
+class RegionColorCondition:
+    """At least `fraction` of the pixels in `region` are within `tolerance` of `color`."""
+    __slots__ = ("region", "color", "tolerance", "fraction")
+
+    def __init__(self, region, color, tolerance=0, fraction=1.0):
+        self.region, self.color, self.tolerance, self.fraction = region, color, tolerance, fraction
+
+    def test(self, capture):
+        from matching import color_match_fraction
+        return color_match_fraction(capture.region_array(self.region), self.color, self.tolerance) >= self.fraction
+
+    def __str__(self):
+        return f"Color {self.color} covers less than {self.fraction:.0%} of region {self.region}."
+
+
+class TemplateCondition:
+    """
+    The template image is found inside `region`.
+
+    `test` returns the screen coordinates of the match center, so the action
+    can target it.
+    """
+    __slots__ = ("region", "image", "threshold", "name")
+
+    def __init__(self, region, image, threshold=20.0, name="template"):
+        self.region, self.image, self.threshold, self.name = region, image, threshold, name
+
+    def test(self, capture):
+        from matching import find_template
+        match = find_template(capture.region_array(self.region), self.image, self.threshold)
+        if match is None:
+            return None
+        height, width = self.image.shape[:2]
+        return self.region[0] + match[0] + width // 2, self.region[1] + match[1] + height // 2
+
+    def __str__(self):
+        return f"Template '{self.name}' not found in region {self.region}."
+
+
+class Instruction:
+    """
+    A single compiled action: an optional condition and a pre-bound input call.
+
+    When `retarget` is set, the condition returns the point to act on and
+    `call` takes it as (x, y). `OP_WAIT` instructions have no call; they wait
+    up to `timeout` seconds for the condition to become `until`. `OP_JUMP`
+    jumps to `target` when it has no condition or the condition's result
+    equals `until`. `name` holds unresolved label and subroutine names until
+    the plan is linked. `index` is the position in the source sequence, or
+    None for subroutine code. `delay` is the recorded gap before the action,
+    or None to use the run's pacing.
+    """
+    __slots__ = ("index", "op", "call", "text", "condition", "retarget", "timeout", "until", "target", "count", "name", "delay")
+
+    def __init__(self, index, call, text, condition=None, retarget=False, op=OP_ACT, timeout=None, until=True, count=0, name=None, delay=None):
+        self.index = index
+        self.op = op
+        self.call = call
+        self.text = text
+        self.condition = condition
+        self.retarget = retarget
+        self.timeout = timeout
+        self.until = until
+        self.target = None
+        self.count = count
+        self.name = name
+        self.delay = delay
+
+    def __repr__(self):
+        return f"Instruction({self.index}, {self.text!r})"
+
+
+class Plan:
+    """
+    A linked program: the main sequence ending in `OP_END`, followed by the
+    code of every subroutine it calls, each ending in `OP_RETURN`.
+
+    `merged` counts source actions removed by turbo coalescing.
+    """
+    __slots__ = ("code", "merged")
+
+    def __init__(self, code, merged=0):
+        self.code = code
+        self.merged = merged
+
+    def __iter__(self):
+        return iter(self.code)
+
+    def __len__(self):
+        return len(self.code)
+
+    def __getitem__(self, i):
+        return self.code[i]
+
+
+def describe_action(action):
+    """Returns the one-line description used in the sequence list and the log ('?' marks a missing field)."""
+    field = lambda name: action.get(name, '?')
+    action_type = field('type')
+    action_str = f"Type: {action_type}"
+    if action_type in ("Label", "Call"): return action_str + f" | Name='{field('name')}'"
+    if action_type == "Repeat": return action_str + f" | Count={field('count')}"
+    if action_type == "Jump":
+        action_str += f" | To='{field('name')}'"
+        if action.get('when', 'always') == 'always': return action_str
+        action_str += f" if {'condition fails' if action['when'] == 'fail' else 'condition matches'}"
+    if action_type in MOUSE_ACTIONS + WAIT_ACTIONS + ("Jump",):
+        action_str += f" | X={field('x')}, Y={field('y')}"
+        if action.get('color'): action_str += f", Color={tuple(action['color'])}"
+        if action.get('tolerance'): action_str += f" ±{action['tolerance']}"
+        if action.get('region'):
+            action_str += f", Region={tuple(action['region'])}"
+            if action.get('color') and action.get('match_percent', 100) != 100: action_str += f" ≥{action['match_percent']}%"
+        if action.get('template'): action_str += f", Find='{os.path.basename(action['template'])}'"
+        if action_type == "Scroll": action_str += f", Amount={field('amount')}"
+        if action_type in WAIT_ACTIONS: action_str += f", Until {action.get('until', 'appears')}, Timeout={action.get('timeout', DEFAULT_WAIT_TIMEOUT):g}s"
+    elif action_type in KEY_ACTIONS: action_str += f" | Key='{field('key')}'"
+    if action.get('delay') is not None: action_str += f" | After {action['delay'] * 1000:.0f} ms"
+    return action_str
+
+
+def _int_field(action, name):
+    value = action.get(name)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise TemplateError(f"'{name}' must be an integer, got {value!r}")
+    return value
+
+
+def _color_field(action):
+    color = action.get('color')
+    if color is None:
+        return None
+    if not isinstance(color, (list, tuple)) or len(color) != 3:
+        raise TemplateError(f"'color' must be an (R, G, B) triple, got {color!r}")
+    for channel in color:
+        if isinstance(channel, bool) or not isinstance(channel, int) or not 0 <= channel <= 255:
+            raise TemplateError(f"color channels must be integers in 0-255, got {color!r}")
+    return tuple(color)
+
+
+def _number_field(action, name, default, low, high):
+    value = action.get(name)
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not low <= value <= high:
+        raise TemplateError(f"'{name}' must be a number in {low}-{high}, got {value!r}")
+    return value
+
+
+def _region_field(action):
+    region = action.get('region')
+    if region is None:
+        return None
+    if not isinstance(region, (list, tuple)) or len(region) != 4 or any(isinstance(v, bool) or not isinstance(v, int) for v in region):
+        raise TemplateError(f"'region' must be [left, top, width, height] integers, got {region!r}")
+    if region[2] <= 0 or region[3] <= 0:
+        raise TemplateError(f"'region' must have a positive size, got {region!r}")
+    return tuple(region)
+
+
+def _condition_field(action, x, y):
+    """Builds the condition object for a mouse action, or None if it is unconditional."""
+    color = _color_field(action)
+    region = _region_field(action)
+    tolerance = _number_field(action, 'tolerance', 0, 0, 255)
+    template = action.get('template')
+    if template:
+        if region is None:
+            raise TemplateError("a template condition needs a 'region' to search")
+        try:
+            from matching import load_image
+            image = load_image(template)
+        except ImportError as e:
+            raise TemplateError(str(e)) from None
+        except OSError as e:
+            raise TemplateError(f"cannot load template image {template!r}: {e}") from None
+        if image.shape[0] > region[3] or image.shape[1] > region[2]:
+            raise TemplateError(f"template image {template!r} is larger than its search region")
+        threshold = _number_field(action, 'threshold', max(tolerance, 20), 0, 255)
+        return TemplateCondition(region, image, threshold, os.path.basename(template))
+    if color is None:
+        return None
+    if region is not None:
+        try: require_numpy()
+        except ImportError as e: raise TemplateError(str(e)) from None
+        fraction = _number_field(action, 'match_percent', 100, 0, 100) / 100
+        return RegionColorCondition(region, color, tolerance, fraction)
+    return PixelCondition(x, y, color, tolerance)
+
+
+def compile_condition(action):
+    """Builds the screen condition described by the x/y, color, region and template fields of `action` (e.g. for a trigger)."""
+    condition = _condition_field(action, _int_field(action, 'x'), _int_field(action, 'y'))
+    if condition is None:
+        raise TemplateError("a screen condition needs a color, region or template")
+    return condition
+
+
+def _key_field(action):
+    key = action.get('key')
+    if not isinstance(key, str) or not key:
+        raise TemplateError("'key' must be a non-empty string")
+    keys = tuple(key.split('+'))
+    if not all(keys):
+        raise TemplateError(f"malformed key combination {key!r}")
+    return keys
+
+
+def _name_field(action):
+    name = action.get('name')
+    if not isinstance(name, str) or not name.strip():
+        raise TemplateError("'name' must be a non-empty string")
+    return name.strip()
+
+
+def compile_action(index, action, backend):
+    """
+    Validates one action dict and returns its `Instruction`.
+
+    Label, jump and call targets are left unresolved; see `link`.
+    """
+    if not isinstance(action, dict):
+        raise TemplateError(f"expected an action object, got {type(action).__name__}")
+    action_type = action.get('type')
+    if action_type not in ACTION_TYPES:
+        raise TemplateError(f"unknown action type {action_type!r}")
+
+    text = describe_action(action)
+    if action_type == "Label": return Instruction(index, None, text, op=_OP_LABEL, name=_name_field(action))
+    if action_type == "Call": return Instruction(index, None, text, op=OP_CALL, name=_name_field(action))
+    if action_type == "End Repeat": return Instruction(index, None, text, op=OP_END_REPEAT)
+    if action_type == "Repeat":
+        count = _int_field(action, 'count')
+        if count < 0: raise TemplateError(f"'count' cannot be negative, got {count}")
+        return Instruction(index, None, text, op=OP_REPEAT, count=count)
+    if action_type == "Jump":
+        name = _name_field(action)
+        when = action.get('when', 'always')
+        if when not in ('always', 'fail', 'match'):
+            raise TemplateError(f"'when' must be 'always', 'fail' or 'match', got {when!r}")
+        if when == 'always':
+            return Instruction(index, None, text, op=OP_JUMP, name=name)
+        condition = _condition_field(action, _int_field(action, 'x'), _int_field(action, 'y'))
+        if condition is None:
+            raise TemplateError("a conditional jump needs a color, region or template condition")
+        return Instruction(index, None, text, condition, op=OP_JUMP, until=when == 'match', name=name)
+
+    delay = _number_field(action, 'delay', None, 0, 86400)
+    if action_type in KEY_ACTIONS:
+        keys = _key_field(action)
+        return Instruction(index, partial(backend.hotkey, *keys), text, delay=delay)
+
+    x, y = _int_field(action, 'x'), _int_field(action, 'y')
+    condition = _condition_field(action, x, y)
+    if action_type in WAIT_ACTIONS:
+        if condition is None:
+            raise TemplateError("a wait needs a color, region or template condition")
+        until = action.get('until', 'appears')
+        if until not in ('appears', 'disappears'):
+            raise TemplateError(f"'until' must be 'appears' or 'disappears', got {until!r}")
+        timeout = _number_field(action, 'timeout', DEFAULT_WAIT_TIMEOUT, 0, 86400)
+        return Instruction(index, None, text, condition, op=OP_WAIT, timeout=timeout, until=until == 'appears')
+    # Template matches supply the target point at run time
+    retarget = isinstance(condition, TemplateCondition)
+    point = () if retarget else (x, y)
+    if action_type == "Left Click": call = partial(backend.click, *point, button='left')
+    elif action_type == "Right Click": call = partial(backend.click, *point, button='right')
+    elif action_type == "Double Click": call = partial(backend.double_click, *point)
+    elif action_type == "Move": call = partial(backend.move, *point)
+    else: call = partial(backend.scroll, _int_field(action, 'amount'), *point)
+    return Instruction(index, call, text, condition, retarget, delay=delay)
+
+
+def _typed_char(action):
+    """Returns the character typed by a plain single-key press, or None."""
+    if action['type'] != "Key Press" or action.get('delay'):
+        return None
+    key = action['key']
+    if key == "space":
+        return " "
+    return key if len(key) == 1 and key.isprintable() else None
+
+
+def _click_signature(action):
+    """Returns ((x, y, button), clicks) for an unconditional click, or None."""
+    if action['type'] not in ("Left Click", "Right Click", "Double Click") or action.get('color') or action.get('template') or action.get('delay'):
+        return None
+    button = 'right' if action['type'] == "Right Click" else 'left'
+    return (action['x'], action['y'], button), 2 if action['type'] == "Double Click" else 1
+
+
+def coalesce(actions, plan, backend):
+    """
+    Merges runs of plain key presses into one `write` call and runs of
+    unconditional clicks on the same point into one multi-click call.
+    Actions with a recorded delay are never merged, so replays keep their timing.
+
+    `plan` is the compiled form of `actions`; merged instructions keep the
+    source index of the first action in the run.
+    """
+    merged = []
+    i, n = 0, len(plan)
+    while i < n:
+        j = i
+        if _typed_char(actions[i]) is not None:
+            text = []
+            while j < n and (char := _typed_char(actions[j])) is not None:
+                text.append(char); j += 1
+            if j - i > 1:
+                text = "".join(text)
+                merged.append(Instruction(plan[i].index, partial(backend.write, text), f"Type: Text | '{text}' ({j - i} key presses)"))
+                i = j
+                continue
+        signature = _click_signature(actions[i])
+        if signature is not None:
+            clicks = 0
+            while j < n and (other := _click_signature(actions[j])) is not None and other[0] == signature[0]:
+                clicks += other[1]; j += 1
+            if j - i > 1:
+                x, y, button = signature[0]
+                merged.append(Instruction(plan[i].index, partial(backend.click, x, y, button, clicks), f"Type: Click x{clicks} | X={x}, Y={y}, Button={button} ({j - i} actions)"))
+                i = j
+                continue
+        merged.append(plan[i])
+        i += 1
+    return merged
+
+
+def _compile_routine(actions, backend, turbo, where):
+    """Compiles and (optionally) coalesces one routine. Returns (instructions, merged count)."""
+    code = []
+    for index, action in enumerate(actions):
+        try:
+            code.append(compile_action(index, action, backend))
+        except TemplateError as e:
+            raise TemplateError(f"{where} {index + 1}: {e}") from None
+    if not turbo:
+        return code, 0
+    # Labels compile to placeholders, which never merge, so runs stop at them
+    merged = coalesce(actions, code, backend)
+    return merged, len(code) - len(merged)
+
+
+def _resolve_routine(code, where):
+    """Removes label placeholders and resolves jump targets and repeat blocks in place (relative to the routine)."""
+    labels, linked = {}, []
+    for ins in code:
+        if ins.op == _OP_LABEL:
+            if ins.name in labels:
+                raise TemplateError(f"{where} {ins.index + 1}: duplicate label '{ins.name}'")
+            labels[ins.name] = len(linked)
+        else:
+            linked.append(ins)
+    blocks = []
+    for i, ins in enumerate(linked):
+        if ins.op == OP_JUMP:
+            if ins.name not in labels:
+                raise TemplateError(f"{where} {ins.index + 1}: unknown label '{ins.name}'")
+            ins.target = labels[ins.name]
+        elif ins.op == OP_REPEAT:
+            blocks.append(i)
+        elif ins.op == OP_END_REPEAT:
+            if not blocks:
+                raise TemplateError(f"{where} {ins.index + 1}: 'End Repeat' without a matching 'Repeat'")
+            begin = blocks.pop()
+            ins.target = begin
+            linked[begin].target = i + 1 # Skip the block when its count is 0
+    if blocks:
+        raise TemplateError(f"{where} {linked[blocks[-1]].index + 1}: 'Repeat' without a matching 'End Repeat'")
+    return linked
+
+
+def _called(code):
+    return {ins.name for ins in code if ins.op == OP_CALL}
+
+
+def link(main, routines):
+    """
+    Lays out `main` followed by each routine in `routines` (name -> code) and
+    resolves jump, repeat and call targets to absolute instruction indices.
+    """
+    code = main + [Instruction(None, None, "End", op=OP_END)]
+    starts = {}
+    for name, body in routines.items():
+        starts[name] = len(code)
+        base = len(code)
+        for ins in body:
+            if ins.op in (OP_JUMP, OP_REPEAT, OP_END_REPEAT): ins.target += base
+        code.extend(body)
+        code.append(Instruction(None, None, f"Return from '{name}'", op=OP_RETURN))
+    for ins in code:
+        if ins.op == OP_CALL: ins.target = starts[ins.name]
+    return code
+
+
+def compile_actions(actions, backend, turbo=False, subroutines=None):
+    """
+    Compiles a list of action dicts into a linked `Plan` bound to `backend`.
+
+    `subroutines` maps names to action lists that 'Call' actions can invoke;
+    only the ones reachable from `actions` are compiled. With `turbo`,
+    consecutive key presses and repeated clicks are coalesced (see
+    `coalesce`). Raises `TemplateError` naming the first invalid action.
+    """
+    subroutines = subroutines or {}
+    main, merged = _compile_routine(actions, backend, turbo, "Action")
+    main = _resolve_routine(main, "Action")
+    routines, pending, callers = {}, [(name, None) for name in sorted(_called(main))], {}
+    while pending:
+        name, caller = pending.pop()
+        if name in routines: continue
+        if name not in subroutines:
+            raise TemplateError(f"unknown subroutine '{name}'" + (f" (called from '{caller}')" if caller else ""))
+        where = f"Subroutine '{name}', action"
+        body, body_merged = _compile_routine(subroutines[name], backend, turbo, where)
+        for ins in body: ins.index = None
+        routines[name] = _resolve_routine(body, where)
+        merged += body_merged
+        callers[name] = _called(routines[name])
+        pending.extend((callee, name) for callee in sorted(callers[name]))
+    _check_recursion(callers)
+    return Plan(link(main, routines), merged)
+
+
+def _check_recursion(callers):
+    """Rejects subroutines that (indirectly) call themselves; repeat counters are not per call."""
+    state = {}
+    def visit(name, path):
+        if state.get(name) == 1:
+            raise TemplateError(f"recursive subroutine call: {' -> '.join(path + [name])}")
+        if state.get(name) == 2: return
+        state[name] = 1
+        for callee in sorted(callers.get(name, ())): visit(callee, path + [name])
+        state[name] = 2
+    for name in sorted(callers): visit(name, [])
+
+
+def _no_log(message, level=INFO):
+    pass
+
+
+class Engine:
+    """
+    Executes compiled plans against a backend.
+
+    Waits poll their condition every `poll_min` seconds at first, doubling
+    the interval up to `poll_max`, so they react quickly to fast UIs without
+    spinning on slow ones.
+
+    `log(message, level)` receives progress messages and `on_step` is called with the source
+    index of each instruction before it runs; both are called from the thread
+    running `run`. `running` and `stop` are safe to use from any thread.
+    If `input_lock` is set, every input call is made while holding it, so
+    sequences running elsewhere (see `triggers.py`) never interleave with it.
+    """
+    def __init__(self, backend, log=None, on_step=None):
+        self.backend = backend
+        self.log = log or _no_log
+        self.on_step = on_step
+        self.capture = FrameCache(grab=backend.screenshot)
+        self._running = threading.Event()
+        self.loops_completed = 0
+        self.last_stats = {}
+        self.poll_min = 0.001
+        self.poll_max = 0.1
+        self.wait_stats = {}
+        self.profile = None
+        self.input_lock = None
+        self._screen = (0, 0)
+
+    def compile(self, actions, turbo=False, subroutines=None):
+        return compile_actions(actions, self.backend, turbo, subroutines)
+
+    @property
+    def running(self):
+        return self._running.is_set()
+
+    @running.setter
+    def running(self, value):
+        if value: self._running.set()
+        else: self._running.clear()
+
+    def stop(self):
+        self.running = False
+
+    def wait_for(self, ins):
+        """
+        Polls `ins.condition` until it equals `ins.until` or `ins.timeout` expires.
+
+        Returns True if the condition was reached. The time taken is added to
+        `wait_stats`. Polls capture only the condition's own region, not the
+        plan-wide area of `self.capture`.
+        """
+        condition, until = ins.condition, ins.until
+        capture = FrameCache(ttl=None, grab=self.backend.screenshot)
+        capture.watch([condition.region])
+        clock, sleep = time.perf_counter, time.sleep
+        start = clock()
+        deadline = start + ins.timeout
+        poll = self.poll_min
+        running = self._running.is_set
+        while running():
+            capture.invalidate() # Every poll needs a fresh frame
+            if bool(condition.test(capture)) == until:
+                met = True
+                break
+            now = clock()
+            if now >= deadline:
+                met = False
+                break
+            sleep(min(poll, deadline - now))
+            poll = min(poll * 2, self.poll_max)
+        else:
+            met = False
+        elapsed = clock() - start
+        self.capture.misses += capture.misses # Report the wait's captures with the run's
+        stats = self.wait_stats
+        stats["count"] += 1
+        stats["total"] += elapsed
+        if elapsed > stats["max"]: stats["max"] = elapsed
+        if not met and running(): stats["timeouts"] += 1
+        self.log(f"Waited {elapsed * 1000:.1f} ms: {ins.text}", DEBUG)
+        return met
+
+    def emergency_stop(self):
+        """Stops the run if the mouse is in a screen corner (the fail-safe gesture). Returns True if it did."""
+        x, y = self.backend.position()
+        if x in (0, self._screen[0] - 1) and y in (0, self._screen[1] - 1):
+            self.log("Emergency stop: mouse moved to a screen corner.", WARNING)
+            self.running = False
+            return True
+        return False
+
+    def run(self, plan, loops=0, delay=1.0, target_rate=0.0, stop_on_fail=False, frame_ttl=0.1, loop_pause=0.1, turbo=False, time_scale=1.0, profile=False):
+        """
+        Runs `plan` for `loops` passes (0 = until stopped) and returns the run statistics.
+
+        A positive `target_rate` (actions per second) replaces `delay` and the
+        `loop_pause` between passes. `frame_ttl` is the maximum age of the
+        cached color-check frame (None keeps it for the whole pass).
+
+        `turbo` turns off the backend's per-call pause and fail-safe for the
+        run; the engine then checks for the corner gesture itself, at least
+        every `EMERGENCY_CHECK_INTERVAL` seconds and while waiting between
+        actions.
+
+        Actions with a recorded `delay` run that many seconds (times
+        `time_scale`) after the previous one; `time_scale=None` ignores
+        recorded delays.
+
+        With `profile`, per-action and per-phase timings are collected into
+        `self.profile` (a `RunProfile`, readable while the run is going).
+        """
+        log, capture = self.log, self.capture
+        self.running = True
+        if turbo:
+            self._screen = self.backend.size()
+            should_stop = lambda: not self._running.is_set() or self.emergency_stop()
+        else:
+            should_stop = lambda: not self._running.is_set()
+        if target_rate > 0: scheduler = Scheduler.for_rate(target_rate, should_stop=should_stop); loop_pause = 0
+        else: scheduler = Scheduler(delay, should_stop=should_stop)
+        capture.ttl = frame_ttl
+        capture.watch(ins.condition.region for ins in plan if ins.condition)
+        capture.reset_stats()
+        self.wait_stats = {"count": 0, "total": 0.0, "max": 0.0, "timeouts": 0}
+        self.profile = RunProfile(plan) if profile else None
+        previous = self.backend.configure(pause=0, failsafe=False) if turbo else None
+        try:
+            loops_completed = self._execute(plan, scheduler, loops, stop_on_fail, loop_pause, turbo, time_scale)
+        finally:
+            self.running = False
+            if previous is not None: self.backend.configure(**previous)
+
+        stats = scheduler.stats()
+        if stats["ticks"]:
+            log(f"Run timing: {stats['ticks']} actions in {stats['elapsed']:.2f}s, achieved {stats['rate']:.2f}/s (target {stats['target_rate']:.2f}/s), "
+                f"jitter {stats['jitter'] * 1000:.2f} ms, max lateness {stats['max_lateness'] * 1000:.2f} ms.")
+        capture_stats = capture.stats()
+        if capture_stats["hits"] or capture_stats["misses"]:
+            log(f"Color checks: {capture_stats['hits'] + capture_stats['misses']} lookups, {capture_stats['misses']} captures ({capture_stats['hits']} served from cache).")
+        waits = self.wait_stats
+        if waits["count"]:
+            log(f"Waits: {waits['count']} took {waits['total']:.2f}s in total, average {waits['total'] / waits['count'] * 1000:.1f} ms, "
+                f"longest {waits['max'] * 1000:.1f} ms, {waits['timeouts']} timed out.")
+        if self.profile:
+            self.profile.finish()
+            log("Run profile:\n" + self.profile.summary_text())
+        log("Automation sequence finished.")
+        stats["loops"] = loops_completed
+        stats["capture"] = capture_stats
+        stats["waits"] = dict(waits)
+        if self.profile: stats["profile"] = self.profile.phases()
+        self.last_stats = stats
+        return stats
+
+    def _pace(self, scheduler, interval, position):
+        """Waits out the slot after the action at `position` (`interval` None = the fixed one). Returns False if stopped."""
+        prof = self.profile
+        if prof: waiting = time.perf_counter()
+        on_time = scheduler.wait(interval=interval)
+        if prof: prof.paced(position, time.perf_counter() - waiting, scheduler.last_lateness if on_time else None)
+        return on_time
+
+    def _execute(self, plan, scheduler, loops, stop_on_fail, loop_pause, turbo, time_scale):
+        """The hot loop of `run`. Returns the number of completed passes."""
+        log, on_step, capture, prof, input_lock = self.log, self.on_step, self.capture, self.profile, self.input_lock
+        clock, running = time.perf_counter, self._running.is_set
+        code = plan.code
+        counters = [0] * len(code) # Remaining iterations, indexed by the Repeat instruction
+        stack = []
+        loops_completed = self.loops_completed = 0
+        check_at = clock() + EMERGENCY_CHECK_INTERVAL
+        while running():
+            if turbo and self.emergency_stop(): break
+            capture.invalidate() # One shared frame per pass
+            ticks = jump_ticks = scheduler.ticks
+            ip = 0
+            pending = None # Position of the last action while its pacing wait is deferred
+            stack.clear()
+            while running():
+                # Short waits never check `should_stop`, so the corner gesture is also polled on a clock budget
+                if turbo and clock() >= check_at:
+                    if self.emergency_stop(): break
+                    check_at = clock() + EMERGENCY_CHECK_INTERVAL
+                ins = code[ip]
+                op = ins.op
+                if op == OP_ACT:
+                    # The wait after the previous action is taken here, once the next action is known:
+                    # its recorded delay replaces the fixed interval, whatever flow instructions lie between
+                    if pending is not None and not self._pace(scheduler, None if ins.delay is None or time_scale is None else ins.delay * time_scale, pending): break
+                    ip += 1
+                    pending = ip - 1
+                    if on_step and ins.index is not None: on_step(ins.index)
+                    condition = ins.condition
+                    if prof: started = clock()
+                    hit = condition.test(capture) if condition else True
+                    if prof: checked = clock()
+                    if not hit:
+                        log(str(condition), WARNING)
+                        if stop_on_fail:
+                            log("Stopping automation due to 'Stop on Fail' being enabled.", WARNING)
+                            self.running = False
+                            break
+                        else:
+                            log("Skipping action due to color mismatch.")
+                            hit = None
+                    if hit:
+                        log(f"Executing: {ins.text}", DEBUG)
+                        if prof: dispatched = clock()
+                        if input_lock is not None:
+                            with input_lock:
+                                if ins.retarget: ins.call(*hit)
+                                else: ins.call()
+                        elif ins.retarget: ins.call(*hit)
+                        else: ins.call()
+                        if prof: prof.acted(ip - 1, checked - started if condition else None, clock() - dispatched)
+                    elif prof: prof.acted(ip - 1, checked - started, None)
+                elif op == OP_JUMP:
+                    if ins.condition is None or bool(ins.condition.test(capture)) == ins.until:
+                        if ins.target <= ip:
+                            # A loop back: take a fresh frame, and pace it like an action if it ran none (a polling loop)
+                            capture.invalidate()
+                            if scheduler.ticks == jump_ticks and pending is None and not scheduler.pause(scheduler.interval): break
+                            jump_ticks = scheduler.ticks
+                        ip = ins.target
+                    else: ip += 1
+                elif op == OP_REPEAT:
+                    counters[ip] = ins.count
+                    ip = ip + 1 if ins.count > 0 else ins.target
+                elif op == OP_END_REPEAT:
+                    counters[ins.target] -= 1
+                    ip = ins.target + 1 if counters[ins.target] > 0 else ip + 1
+                elif op == OP_CALL:
+                    if len(stack) >= MAX_CALL_DEPTH:
+                        log(f"Call depth limit ({MAX_CALL_DEPTH}) exceeded at: {ins.text}", WARNING)
+                        self.running = False
+                        break
+                    stack.append(ip + 1)
+                    ip = ins.target
+                elif op == OP_RETURN:
+                    ip = stack.pop()
+                elif op == OP_WAIT:
+                    if pending is not None and not self._pace(scheduler, None, pending): break
+                    pending = None
+                    ip += 1
+                    if on_step and ins.index is not None: on_step(ins.index)
+                    if prof: waiting = clock()
+                    met = self.wait_for(ins)
+                    if prof: prof.waited(ip - 1, clock() - waiting)
+                    scheduler.resync() # Continue as soon as the condition is met
+                    if met or not running(): continue
+                    log(f"Timed out after {ins.timeout:g}s: {ins.text}", WARNING)
+                    if stop_on_fail:
+                        log("Stopping automation due to 'Stop on Fail' being enabled.", WARNING)
+                        self.running = False
+                        break
+                else: # OP_END
+                    if pending is not None: self._pace(scheduler, None, pending)
+                    break
+
+            if not running(): break
+
+            loops_completed += 1
+            self.loops_completed = loops_completed
+            if loops > 0:
+                log(f"Loop {loops_completed}/{loops} completed.")
+                if loops_completed >= loops:
+                    self.running = False
+            else:
+                log("Loop completed, starting next iteration.")
+
+            if running() and scheduler.ticks == ticks: scheduler.pause(max(loop_pause, IDLE_PASS_PAUSE))
+            elif running() and loop_pause: scheduler.pause(loop_pause)
+        return loops_completed
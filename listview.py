@@ -0,0 +1,146 @@
+"""
+Virtualized, incremental view of the action sequence.
+
+Rebuilding every Listbox row on each edit, and posting a selection change to
+Tk for every executed action, does not scale to templates with thousands of
+actions. `SequenceView` keeps the formatted row strings in a cache that is
+updated per edit, puts only the rows that fit on screen into the Listbox
+(replacing just the ones that changed), and applies the execution highlight
+from a UI timer at display rate instead of once per action.
+"""
+import tkinter as tk
+
+_CLEAR = -1
+
+
+class SequenceView:
+    """
+    Shows `items` (a list owned by the caller) in `listbox`, with `scrollbar`
+    driving the visible window. Call `inserted`, `extended`, `removed`,
+    `changed`, `swapped` or `reset` after editing the list.
+    """
+    def __init__(self, listbox, scrollbar, items, format_row, refresh_ms=16):
+        self.listbox = listbox
+        self.scrollbar = scrollbar
+        self.items = items
+        self.format_row = format_row
+        self.refresh_ms = refresh_ms
+        self.top = 0
+        self.selected = None
+        self._rows = []
+        self._shown = []
+        self._pending_highlight = None
+
+        scrollbar.config(command=self.yview)
+        listbox.bind("<<ListboxSelect>>", self._on_select)
+        listbox.bind("<MouseWheel>", self._on_wheel)
+        listbox.bind("<Button-4>", lambda e: self.scroll(-3))
+        listbox.bind("<Button-5>", lambda e: self.scroll(3))
+        self._tick()
+
+    # --- Model updates ---
+    def reset(self, items=None):
+        """Re-reads the whole list, e.g. after loading a template."""
+        if items is not None: self.items = items
+        self._rows = [self.format_row(item) for item in self.items]
+        self.selected = None
+        self.top = 0
+        self.render()
+
+    def inserted(self, index):
+        self._rows.insert(index, self.format_row(self.items[index]))
+        self.render()
+
+    def extended(self, start):
+        """Formats the rows appended from `start` onwards, e.g. one batch of a background load."""
+        self._rows.extend(self.format_row(item) for item in self.items[start:])
+        self.render()
+
+    def removed(self, index):
+        del self._rows[index]
+        if self.selected is not None:
+            if self.selected == index: self.selected = None
+            elif self.selected > index: self.selected -= 1
+        self.render()
+
+    def changed(self, index):
+        self._rows[index] = self.format_row(self.items[index])
+        self.render()
+
+    def swapped(self, i, j):
+        self._rows[i], self._rows[j] = self._rows[j], self._rows[i]
+        self.render()
+
+    # --- Selection and highlight ---
+    def select(self, index):
+        """Selects `index` (or clears the selection when None) and scrolls it into view."""
+        self.selected = index
+        if index is not None: self.see(index)
+        self.render()
+
+    def request_highlight(self, index):
+        """Marks `index` as executing. Safe to call from any thread; applied on the next UI tick."""
+        self._pending_highlight = index
+
+    def clear_highlight(self):
+        self._pending_highlight = _CLEAR
+
+    def _tick(self):
+        pending, self._pending_highlight = self._pending_highlight, None
+        if pending is not None:
+            self.select(None if pending == _CLEAR else pending)
+        self.listbox.after(self.refresh_ms, self._tick)
+
+    def _on_select(self, event):
+        rows = self.listbox.curselection()
+        if rows: self.selected = self.top + rows[0]
+
+    # --- Scrolling ---
+    @property
+    def visible_rows(self):
+        return max(1, int(self.listbox.cget("height")))
+
+    def see(self, index):
+        if index < self.top: self.top = index
+        elif index >= self.top + self.visible_rows: self.top = index - self.visible_rows + 1
+
+    def scroll(self, rows):
+        self.top += rows
+        self.render()
+        return "break"
+
+    def _on_wheel(self, event):
+        return self.scroll(-3 if event.delta > 0 else 3)
+
+    def yview(self, *args):
+        """Scrollbar command: ('moveto', fraction) or ('scroll', n, 'units'|'pages')."""
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * len(self._rows))
+        elif args[0] == "scroll":
+            step = self.visible_rows if args[2] == "pages" else 1
+            self.top += int(args[1]) * step
+        self.render()
+
+    # --- Rendering ---
+    def render(self):
+        """Brings the Listbox in line with the visible window, touching only rows that differ."""
+        count, height = len(self._rows), self.visible_rows
+        self.top = max(0, min(self.top, count - height))
+        wanted = self._rows[self.top:self.top + height]
+        shown = self._shown
+        for row, text in enumerate(wanted):
+            if row < len(shown):
+                if shown[row] != text:
+                    self.listbox.delete(row)
+                    self.listbox.insert(row, text)
+            else:
+                self.listbox.insert(tk.END, text)
+        if len(shown) > len(wanted):
+            self.listbox.delete(len(wanted), tk.END)
+        self._shown = wanted
+
+        self.listbox.selection_clear(0, tk.END)
+        if self.selected is not None and self.top <= self.selected < self.top + height:
+            self.listbox.selection_set(self.selected - self.top)
+        if count > height: self.scrollbar.set(self.top / count, (self.top + height) / count)
+        else: self.scrollbar.set(0, 1)
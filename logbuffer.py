@@ -0,0 +1,121 @@
+"""
+Bounded, batched logging.
+
+Messages go into a fixed-size ring buffer that the UI drains on a single
+periodic timer, instead of one Tk callback per message. Levels let the noisy
+per-action lines be sampled or turned off, and `RotatingLogWriter` streams
+lines to disk on a background thread so long runs keep constant memory.
+"""
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+
+class LogBuffer:
+    """
+    A thread-safe ring buffer of formatted log lines.
+
+    Messages below `level` are dropped. DEBUG messages are additionally
+    sampled: only every `sample_every`-th one is kept. When the buffer is full
+    the oldest lines are discarded and counted in `dropped`.
+    """
+    def __init__(self, capacity=2000, level=DEBUG, sample_every=1, writer=None):
+        self._lines = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self.level = level
+        self.sample_every = sample_every
+        self.writer = writer
+        self.dropped = 0
+        self._debug_count = 0
+        self._stamp_second = None
+        self._stamp = ""
+
+    def _timestamp(self):
+        second = int(time.time())
+        if second != self._stamp_second:
+            self._stamp_second = second
+            self._stamp = time.strftime("%H:%M:%S", time.localtime(second))
+        return self._stamp
+
+    def emit(self, message, level=INFO):
+        """Formats and buffers `message`. Returns the line, or None if it was filtered out."""
+        if level < self.level:
+            return None
+        if level == DEBUG and self.sample_every > 1:
+            self._debug_count += 1
+            if self._debug_count % self.sample_every:
+                return None
+        line = f"[{self._timestamp()}] {message}\n"
+        with self._lock:
+            if len(self._lines) == self._lines.maxlen: self.dropped += 1
+            self._lines.append(line)
+        writer = self.writer
+        if writer is not None: writer.write(line)
+        return line
+
+    def drain(self):
+        """Removes and returns all buffered lines, oldest first."""
+        with self._lock:
+            lines = list(self._lines)
+            self._lines.clear()
+        return lines
+
+
+class RotatingLogWriter:
+    """
+    Appends log lines to `path` from a background thread.
+
+    When the file grows past `max_bytes` it is renamed to `path.1` (shifting
+    older files up to `backup_count`) and a new file is started.
+    """
+    def __init__(self, path, max_bytes=5 * 1024 * 1024, backup_count=3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._queue = queue.SimpleQueue()
+        self._file = open(path, "a", encoding="utf-8")
+        self._size = self._file.tell()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, line):
+        self._queue.put(line)
+
+    def close(self):
+        """Flushes pending lines and stops the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src): os.replace(src, f"{self.path}.{i + 1}")
+        if self.backup_count > 0: os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._size = 0
+
+    def _run(self):
+        get = self._queue.get
+        while True:
+            line = get()
+            # Batch whatever else is already queued into one write
+            batch = []
+            while line is not None:
+                batch.append(line)
+                try: line = self._queue.get_nowait()
+                except queue.Empty: break
+            if batch:
+                data = "".join(batch)
+                self._file.write(data)
+                self._file.flush()
+                self._size += len(data)
+                if self._size >= self.max_bytes: self._rotate()
+            if line is None:
+                self._file.close()
+                return
@@ -0,0 +1,142 @@
+"""
+Vectorized region conditions.
+
+Exact single-pixel equality breaks on anti-aliasing or a one-unit shade
+change and cannot say "this button is somewhere in this area". These helpers
+evaluate tolerant color matches and template searches over a captured region
+with NumPy, using a coarse-to-fine search so a check stays in the low
+milliseconds. NumPy (and Pillow, for loading template images) are imported
+lazily so the rest of the app works without them.
+"""
+import math
+
+
+def require_numpy():
+    """Imports NumPy, raising a readable ImportError if it is missing."""
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Region and template conditions require NumPy (pip install numpy)") from None
+    return numpy
+
+
+def pixel_matches(pixel, color, tolerance=0):
+    """True if every channel of `pixel` is within `tolerance` of `color`."""
+    if not tolerance:
+        return pixel == color
+    return abs(pixel[0] - color[0]) <= tolerance and abs(pixel[1] - color[1]) <= tolerance and abs(pixel[2] - color[2]) <= tolerance
+
+
+def to_array(image):
+    """Converts a captured image (PIL or `FakeImage`) to an (H, W, 3) uint8 array."""
+    return require_numpy().asarray(image)[..., :3]
+
+
+def load_image(path):
+    """Loads an image file as an (H, W, 3) uint8 array."""
+    np = require_numpy()
+    from PIL import Image
+    with Image.open(path) as image:
+        return np.asarray(image.convert("RGB")).copy()
+
+
+def color_match_fraction(region, color, tolerance=0):
+    """Returns the fraction (0-1) of pixels in `region` within `tolerance` of `color`."""
+    np = require_numpy()
+    diff = np.abs(region.astype(np.int16) - np.asarray(color, dtype=np.int16))
+    return float((diff.max(axis=2) <= tolerance).mean())
+
+
+def _gray(image):
+    """Sums the channels of an (H, W, 3) uint8 array into a float (H, W) array."""
+    np = require_numpy()
+    return image[..., 0].astype(np.float64) + image[..., 1] + image[..., 2]
+
+
+def _block_sum(image, factor):
+    """Downsamples an (H, W) array by summing `factor` x `factor` blocks (edges that don't fill a block are dropped)."""
+    h, w = image.shape[0] // factor * factor, image.shape[1] // factor * factor
+    return image[:h, :w].reshape(h // factor, factor, w // factor, factor).sum(axis=3).sum(axis=1)
+
+
+def _ssd_maps(haystack, needles):
+    """
+    Yields the sum of squared differences of each needle at every offset in
+    `haystack` (2-D float arrays). The haystack's FFT and the integral image
+    of its squares are computed once, and each map costs one FFT
+    cross-correlation, whatever the needle size.
+    """
+    np = require_numpy()
+    hh, hw = haystack.shape
+    spectrum = np.fft.rfft2(haystack)
+    squares = np.pad((haystack * haystack).cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+    for needle in needles:
+        nh, nw = needle.shape
+        # Circular wrap-around only touches offsets outside the valid range
+        cross = np.fft.irfft2(spectrum * np.fft.rfft2(needle[::-1, ::-1], s=(hh, hw)), s=(hh, hw))[nh - 1:, nw - 1:]
+        windows = squares[nh:, nw:] - squares[:-nh, nw:] - squares[nh:, :-nw] + squares[:-nh, :-nw]
+        yield windows - 2 * cross + (needle * needle).sum()
+
+
+def _mean_abs_diff(haystack, needle, x, y):
+    np = require_numpy()
+    nh, nw = needle.shape[:2]
+    return float(np.abs(haystack[y:y + nh, x:x + nw].astype(np.int16) - needle).mean())
+
+
+# Largest coarse search level, in pixels, before the haystack is downscaled further
+COARSE_PIXELS = 256 * 256
+
+
+def find_template(haystack, needle, threshold=20.0, downscale=None, candidates=3):
+    """
+    Searches `haystack` for `needle` (both (H, W, 3) uint8 arrays).
+
+    Offsets are first ranked on channel sums block-averaged by `downscale`
+    (chosen from the region and needle sizes when None), once for each
+    alignment of the needle to the blocks, so every offset is scored. The
+    best `candidates` are then scored exactly; if none is within
+    `threshold`, ten times as many are tried. Returns `(x, y, score)` of the
+    best match's top-left corner, where `score` is the mean absolute channel
+    difference (0-255), or None if no match scores `threshold` or better.
+    """
+    np = require_numpy()
+    hh, hw = haystack.shape[:2]
+    nh, nw = needle.shape[:2]
+    if nh > hh or nw > hw:
+        return None
+    if downscale is None:
+        # Coarse enough to keep the first level small, but the needle keeps at least 4 px per side
+        downscale = math.ceil(math.sqrt(hh * hw / COARSE_PIXELS))
+        downscale = max(1, min(downscale, min(nh, nw) // 4))
+    d = max(1, min(downscale, nh, nw))
+    hay, ndl = _gray(haystack), _gray(needle)
+    phases = [(py, px) for py in range(d) for px in range(d)]
+    parts = (_block_sum(ndl[py:, px:], d) for py, px in phases) if d > 1 else [ndl]
+    coarse = _block_sum(hay, d) if d > 1 else hay
+
+    # A needle starting `py` rows into a block lines up with the blocks after dropping its first `py` rows
+    limit = candidates * 10
+    ranked = []
+    for (py, px), ssd in zip(phases, _ssd_maps(coarse, parts)):
+        flat = ssd.ravel()
+        count = min(limit, flat.size)
+        for i in np.argpartition(flat, count - 1)[:count]:
+            cy, cx = divmod(int(i), ssd.shape[1])
+            y, x = cy * d - py, cx * d - px
+            if 0 <= y <= hh - nh and 0 <= x <= hw - nw: ranked.append((float(flat[i]), x, y))
+    ranked.sort()
+
+    exact = needle.astype(np.int16)
+    result, tried = None, 0
+    for count in (candidates, limit):
+        for _, x, y in ranked[tried:count]:
+            score = _mean_abs_diff(haystack, exact, x, y)
+            if result is None or score < result[2]:
+                result = (x, y, score)
+        tried = count
+        if result is None or result[2] <= threshold or tried >= len(ranked):
+            break
+    if result is None or result[2] > threshold:
+        return None
+    return result
@@ -0,0 +1,169 @@
+"""
+Run profiling.
+
+`RunProfile` collects timings from inside the engine's run loop: a histogram
+per phase of an action (the condition check, the input dispatch, the wait
+after it and the scheduler's wake-up overshoot) plus totals and maxima per
+plan position. Everything is allocated before the run starts, so recording a
+sample is a few array updates. Profiles export to JSON (all data) or CSV (one row per
+action), and those files can be diffed between template versions.
+"""
+import math
+import time
+from array import array
+
+PHASES = ("condition", "dispatch", "wait", "overshoot")
+
+
+def format_duration(seconds):
+    """Formats a duration with a unit that suits its size (µs, ms or s)."""
+    if seconds < 1e-3: return f"{seconds * 1e6:.0f} µs"
+    if seconds < 1.0: return f"{seconds * 1e3:.1f} ms"
+    return f"{seconds:.2f} s"
+
+
+class Histogram:
+    """
+    Log-scale histogram of durations with fixed memory.
+
+    Bucket edges start at `MIN_SECONDS`. Each doubling of the duration is
+    split into `STEPS` linear buckets, so each bucket is at most 25% wide.
+    Durations below 1 µs share the first bucket, and durations above about
+    2 minutes share the last.
+    """
+    MIN_SECONDS = 1e-6
+    STEPS = 4
+    OCTAVES = 28
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = array("Q", bytes(8 * self.STEPS * self.OCTAVES))
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        if seconds < self.MIN_SECONDS:
+            bucket = 0
+        else:
+            mantissa, exponent = math.frexp(seconds / self.MIN_SECONDS)
+            bucket = min((exponent - 1) * self.STEPS + int((mantissa - 0.5) * 2 * self.STEPS), len(self.counts) - 1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max: self.max = seconds
+
+    def upper_bound(self, bucket):
+        octave, step = divmod(bucket, self.STEPS)
+        return self.MIN_SECONDS * 2 ** octave * (1 + (step + 1) / self.STEPS)
+
+    def percentile(self, fraction):
+        """Returns an upper estimate of the `fraction` percentile (0 if empty)."""
+        if not self.count: return 0.0
+        rank, seen = fraction * self.count, 0
+        for bucket, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(self.upper_bound(bucket), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self):
+        return {
+            "count": self.count, "total": self.total, "mean": self.mean,
+            "p50": self.percentile(0.5), "p90": self.percentile(0.9), "p99": self.percentile(0.99), "max": self.max,
+        }
+
+
+class RunProfile:
+    """
+    Timings of one run of a plan.
+
+    The engine calls `acted`, `paced` and `waited` with the plan position of
+    the instruction and the measured durations in seconds.
+    """
+    def __init__(self, plan):
+        n = len(plan)
+        self.texts = [ins.text for ins in plan]
+        self.indices = [ins.index for ins in plan]
+        self.condition, self.dispatch, self.wait, self.overshoot = (Histogram() for _ in PHASES)
+        self.counts = array("Q", bytes(8 * n))
+        self.condition_total = array("d", bytes(8 * n))
+        self.condition_max = array("d", bytes(8 * n))
+        self.dispatch_total = array("d", bytes(8 * n))
+        self.dispatch_max = array("d", bytes(8 * n))
+        self.wait_total = array("d", bytes(8 * n))
+        self.started = time.time()
+        self.elapsed = 0.0
+        self._clock_start = time.perf_counter()
+
+    def acted(self, position, condition, dispatch):
+        """Records an action; `condition` is None without a condition and `dispatch` is None when it was skipped."""
+        self.counts[position] += 1
+        if condition is not None:
+            self.condition.add(condition)
+            self.condition_total[position] += condition
+            if condition > self.condition_max[position]: self.condition_max[position] = condition
+        if dispatch is not None:
+            self.dispatch.add(dispatch)
+            self.dispatch_total[position] += dispatch
+            if dispatch > self.dispatch_max[position]: self.dispatch_max[position] = dispatch
+
+    def paced(self, position, waited, lateness):
+        """Records the pacing wait after the action at `position`; `lateness` is None if the wait was interrupted."""
+        self.wait.add(waited)
+        self.wait_total[position] += waited
+        if lateness is not None: self.overshoot.add(max(lateness, 0.0))
+
+    def waited(self, position, seconds):
+        """Records a Wait For action."""
+        self.counts[position] += 1
+        self.wait.add(seconds)
+        self.wait_total[position] += seconds
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self._clock_start
+
+    def phases(self):
+        return {name: getattr(self, name).summary() for name in PHASES}
+
+    def actions(self):
+        """Per-position totals for every instruction that ran at least once, in plan order."""
+        rows = []
+        for position, count in enumerate(self.counts):
+            if not count: continue
+            rows.append({
+                "position": position, "index": self.indices[position], "action": self.texts[position], "count": count,
+                "condition_mean": self.condition_total[position] / count, "condition_max": self.condition_max[position],
+                "dispatch_mean": self.dispatch_total[position] / count, "dispatch_max": self.dispatch_max[position],
+                "wait_total": self.wait_total[position],
+            })
+        return rows
+
+    def summary_text(self):
+        """One line per phase, as shown in the UI and the log."""
+        lines = []
+        for name in PHASES:
+            h = getattr(self, name)
+            if h.count:
+                lines.append(f"{name:<10} n={h.count:<8} mean {format_duration(h.mean):>9}  p99 {format_duration(h.percentile(0.99)):>9}  max {format_duration(h.max):>9}")
+        return "\n".join(lines)
+
+    def to_dict(self):
+        return {"started": self.started, "elapsed": self.elapsed, "phases": self.phases(), "actions": self.actions()}
+
+    def export(self, path):
+        """Writes the profile as CSV (one row per action) if `path` ends in '.csv', JSON otherwise."""
+        import csv
+        import json
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            if path.lower().endswith(".csv"):
+                rows = self.actions()
+                writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ["position"])
+                writer.writeheader()
+                writer.writerows(rows)
+            else:
+                json.dump(self.to_dict(), f, indent=2)
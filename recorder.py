@@ -0,0 +1,245 @@
+"""
+Input recording.
+
+Hooks the keyboard (`keyboard`) and mouse (`mouse`) and stores every event in
+parallel `array` buffers (timestamp, kind, code, x, y), about 19 bytes per
+event instead of one object each, so long recordings at the mouse's full
+report rate stay small. Key names are interned and stored by index.
+
+`Recorder.to_actions` turns a recording into a sequence: mouse paths are
+simplified with Ramer-Douglas-Peucker into a few `Move` actions, button
+presses, wheel notches and key combos become clicks, scrolls and key presses,
+and each action carries the gap before it as `delay` (idle gaps capped), which
+the engine replays as recorded or scaled.
+"""
+import math
+import threading
+from array import array
+
+# Event kinds
+MOVE, BUTTON_DOWN, BUTTON_UP, WHEEL, KEY_DOWN, KEY_UP = range(6)
+
+BUTTONS = ("left", "right", "middle", "x", "x2")
+MODIFIERS = ("ctrl", "shift", "alt", "win")
+
+# `keyboard` key names -> the names Key Press actions use
+_KEY_NAMES = {
+    "control": "ctrl", "windows": "win", "escape": "esc", "return": "enter",
+    "page up": "pageup", "page down": "pagedown", "caps lock": "capslock",
+    "num lock": "numlock", "scroll lock": "scrolllock", "print screen": "printscreen",
+}
+
+
+def key_name(name):
+    """Maps a `keyboard` event name ('left ctrl', 'A', 'page up') to a Key Press key name."""
+    name = name.lower()
+    for side in ("left ", "right "):
+        if name.startswith(side): name = name[len(side):]
+    return _KEY_NAMES.get(name, name)
+
+
+def simplify(xs, ys, epsilon):
+    """
+    Ramer-Douglas-Peucker: returns the indices of the points of the path
+    (xs, ys) to keep so that no dropped point is further than `epsilon`
+    pixels from the simplified path. The end points are always kept.
+    """
+    n = len(xs)
+    if n < 3:
+        return list(range(n))
+    keep = bytearray(n)
+    keep[0] = keep[-1] = 1
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        x0, y0 = xs[first], ys[first]
+        dx, dy = xs[last] - x0, ys[last] - y0
+        norm = math.hypot(dx, dy)
+        best, index = -1.0, first
+        for i in range(first + 1, last):
+            if norm: d = abs(dy * (xs[i] - x0) - dx * (ys[i] - y0)) / norm
+            else: d = math.hypot(xs[i] - x0, ys[i] - y0)
+            if d > best: best, index = d, i
+        if best > epsilon:
+            keep[index] = 1
+            stack.append((first, index))
+            stack.append((index, last))
+    return [i for i in range(n) if keep[i]]
+
+
+class Recorder:
+    """
+    Records mouse and keyboard input between `start` and `stop`.
+
+    The hooks only append to the buffers; all interpretation happens later in
+    `to_actions`. `add` can also be fed events directly (e.g. from a replayed
+    log) with `time.time()`-style timestamps.
+    """
+    def __init__(self):
+        self.times = array("d")
+        self.kinds = array("B")
+        self.codes = array("h") # Button index, interned key id or wheel notches
+        self.xs = array("i")
+        self.ys = array("i")
+        self.keys = [] # Interned key names
+        self._key_ids = {}
+        self._lock = threading.Lock()
+        self._hooks = None
+        self._x = self._y = 0
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def recording(self):
+        return self._hooks is not None
+
+    @property
+    def nbytes(self):
+        return sum(a.itemsize * len(a) for a in (self.times, self.kinds, self.codes, self.xs, self.ys))
+
+    def clear(self):
+        with self._lock:
+            for buffer in (self.times, self.kinds, self.codes, self.xs, self.ys):
+                del buffer[:]
+
+    # --- Capture ---
+    def start(self):
+        """Installs the keyboard and mouse hooks. Raises ImportError if the `mouse` package is missing."""
+        if self._hooks: return
+        import keyboard
+        try:
+            import mouse
+        except ImportError:
+            raise ImportError("Recording needs the 'mouse' package (pip install mouse).") from None
+        self._x, self._y = mouse.get_position()
+        self._hooks = (keyboard.hook(self._on_key), mouse.hook(self._on_mouse))
+
+    def stop(self):
+        if not self._hooks: return
+        import keyboard
+        import mouse
+        key_hook, mouse_hook = self._hooks
+        keyboard.unhook(key_hook)
+        mouse.unhook(mouse_hook)
+        self._hooks = None
+
+    def add(self, t, kind, code=0, x=0, y=0):
+        with self._lock:
+            self._append(t, kind, code, x, y)
+
+    def _append(self, t, kind, code, x, y):
+        self.times.append(t); self.kinds.append(kind); self.codes.append(code)
+        self.xs.append(x); self.ys.append(y)
+
+    def intern(self, name):
+        """Returns the id of key `name`, adding it to the table if needed."""
+        key_id = self._key_ids.get(name)
+        if key_id is None:
+            key_id = self._key_ids[name] = len(self.keys)
+            self.keys.append(name)
+        return key_id
+
+    def _on_key(self, event):
+        if not event.name: return
+        with self._lock:
+            kind = KEY_DOWN if event.event_type == "down" else KEY_UP
+            self._append(event.time, kind, self.intern(key_name(event.name)), 0, 0)
+
+    def _on_mouse(self, event):
+        with self._lock:
+            if hasattr(event, "x"): # MoveEvent
+                self._x, self._y = event.x, event.y
+                self._append(event.time, MOVE, 0, event.x, event.y)
+            elif hasattr(event, "button"): # ButtonEvent: 'down', 'up' or 'double'
+                if event.button not in BUTTONS: return
+                kind = BUTTON_UP if event.event_type == "up" else BUTTON_DOWN
+                self._append(event.time, kind, BUTTONS.index(event.button), self._x, self._y)
+            else: # WheelEvent
+                self._append(event.time, WHEEL, int(round(event.delta)), self._x, self._y)
+
+    # --- Conversion ---
+    def to_actions(self, epsilon=3.0, max_idle=1.0, double_click_time=0.4, moves=True, ignore=()):
+        """
+        Converts the recording into a list of action dicts.
+
+        Mouse paths between other events are simplified to within `epsilon`
+        pixels (`moves=False` drops them), gaps longer than `max_idle`
+        seconds are shortened to it, and two left clicks on the same spot
+        within `double_click_time` become a Double Click. Key combos in
+        `ignore` (e.g. the recording hotkey) are left out. A drag is
+        recorded as a click where the button went down, followed by the path.
+        """
+        with self._lock:
+            times, kinds, codes = self.times[:], self.kinds[:], self.codes[:]
+            xs, ys, keys = self.xs[:], self.ys[:], list(self.keys)
+
+        actions = []
+        last_time = None
+        path = [] # Indices of the moves since the last action
+        held, combo_used = [], False
+        last_click = None # (action, time) of the last single left click
+
+        def emit(action, t):
+            nonlocal last_time
+            action["delay"] = 0.0 if last_time is None else round(min(max(t - last_time, 0.0), max_idle), 3)
+            last_time = t
+            actions.append(action)
+
+        def flush_path(until=None):
+            if moves and path:
+                kept = simplify([xs[i] for i in path], [ys[i] for i in path], epsilon)
+                for k in kept:
+                    i = path[k]
+                    if until is not None and (xs[i], ys[i]) == until: continue # The next action moves there anyway
+                    emit({"type": "Move", "x": xs[i], "y": ys[i]}, times[i])
+            path.clear()
+
+        for i in range(len(times)):
+            kind, t = kinds[i], times[i]
+            if kind == MOVE:
+                path.append(i)
+            elif kind == BUTTON_DOWN:
+                # Emitted on press, so keys, scrolls or other buttons during a drag stay in time order
+                flush_path((xs[i], ys[i]))
+                if codes[i] > 1: continue # Only left and right clicks map to actions
+                x, y = xs[i], ys[i]
+                if (codes[i] == 0 and last_click and actions and actions[-1] is last_click[0] and t - last_click[1] <= double_click_time
+                        and abs(last_click[0]["x"] - x) <= 4 and abs(last_click[0]["y"] - y) <= 4):
+                    last_click[0]["type"] = "Double Click"
+                    last_click = None
+                    continue
+                action = {"type": "Left Click" if codes[i] == 0 else "Right Click", "x": x, "y": y}
+                emit(action, t)
+                last_click = (action, t) if codes[i] == 0 else None
+            elif kind == BUTTON_UP:
+                pass # Clicks were emitted on press
+            elif kind == WHEEL:
+                flush_path((xs[i], ys[i]))
+                previous = actions[-1] if actions else None
+                if previous and previous["type"] == "Scroll" and (previous["x"], previous["y"]) == (xs[i], ys[i]) and t - last_time <= 0.3:
+                    previous["amount"] += codes[i] # Consecutive notches form one scroll
+                    last_time = t
+                else:
+                    emit({"type": "Scroll", "x": xs[i], "y": ys[i], "amount": codes[i]}, t)
+            elif kind == KEY_DOWN:
+                name = keys[codes[i]]
+                if name in MODIFIERS:
+                    if name not in held: held.append(name)
+                    continue
+                flush_path()
+                combo = "+".join(held + [name])
+                if held: combo_used = True
+                if combo not in ignore: emit({"type": "Key Press", "key": combo}, t)
+            else: # KEY_UP
+                name = keys[codes[i]]
+                if name not in held: continue
+                if not combo_used: # A modifier tapped on its own
+                    combo = "+".join(held)
+                    if combo not in ignore:
+                        flush_path(); emit({"type": "Key Press", "key": combo}, t)
+                    combo_used = True
+                held.remove(name)
+                if not held: combo_used = False
+        flush_path()
+        return [a for a in actions if a["type"] != "Scroll" or a["amount"]]
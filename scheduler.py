@@ -0,0 +1,102 @@
+"""
+Drift-free action pacing.
+
+Sleeping a fixed delay after each action lets execution time and sleep
+overshoot pile up, so long runs drift and never hit the configured rate.
+`Scheduler` instead advances an absolute deadline on the monotonic clock by
+one interval per action and waits for it with a hybrid sleep/spin, so errors
+do not accumulate.
+"""
+import math
+import time
+
+
+def wait_until(deadline, spin=0.002, should_stop=None, slice=0.05):
+    """
+    Waits until `time.perf_counter()` reaches `deadline`.
+
+    Sleeps in slices of at most `slice` seconds (so `should_stop` is checked
+    regularly) and busy-waits the final `spin` seconds, where `time.sleep` is
+    too coarse. Returns False if `should_stop` asked to stop early.
+    """
+    clock, sleep = time.perf_counter, time.sleep
+    while True:
+        remaining = deadline - clock()
+        if remaining <= spin:
+            break
+        if should_stop is not None and should_stop():
+            return False
+        sleep(min(remaining - spin, slice))
+    while clock() < deadline:
+        pass
+    return True
+
+
+class Scheduler:
+    """
+    Paces actions at a fixed interval against monotonic deadlines.
+
+    Call `start` once, then `wait` after every action. The lateness of each
+    wake-up is recorded so `stats` can report the achieved rate and jitter.
+    If the run falls behind by more than `max_lag` seconds (e.g. a slow input
+    call), the schedule is re-anchored instead of bursting to catch up.
+    """
+    def __init__(self, interval, spin=0.002, max_lag=0.25, should_stop=None):
+        self.interval = interval
+        self.spin = spin
+        self.max_lag = max_lag
+        self.should_stop = should_stop
+        self.start()
+
+    @classmethod
+    def for_rate(cls, actions_per_second, **kwargs):
+        """Creates a scheduler targeting the given number of actions per second."""
+        return cls(1.0 / actions_per_second, **kwargs)
+
+    def start(self):
+        self.started = self.deadline = time.perf_counter()
+        self.ticks = 0
+        self.last_lateness = 0.0
+        self._lateness_sum = 0.0
+        self._lateness_sq = 0.0
+        self._lateness_max = 0.0
+
+    def wait(self, extra=0.0, interval=None):
+        """
+        Waits for the next slot, `extra` seconds further out. `interval`
+        overrides the fixed interval for this slot. Returns False if stopped.
+        """
+        self.deadline += (self.interval if interval is None else interval) + extra
+        now = time.perf_counter()
+        if now - self.deadline > self.max_lag:
+            self.deadline = now
+        if not wait_until(self.deadline, self.spin, self.should_stop):
+            return False
+        lateness = self.last_lateness = time.perf_counter() - self.deadline
+        self.ticks += 1
+        self._lateness_sum += lateness
+        self._lateness_sq += lateness * lateness
+        if lateness > self._lateness_max: self._lateness_max = lateness
+        return True
+
+    def resync(self):
+        """Re-anchors the schedule at the current time, e.g. after an event-driven wait."""
+        self.deadline = time.perf_counter()
+
+    def pause(self, seconds):
+        """Pushes the schedule back by `seconds` and waits for it, without counting a tick."""
+        self.deadline = max(self.deadline, time.perf_counter() - self.max_lag) + seconds
+        return wait_until(self.deadline, self.spin, self.should_stop)
+
+    def stats(self):
+        """Returns the achieved rate and wake-up jitter (in seconds) since `start`."""
+        elapsed = time.perf_counter() - self.started
+        n = self.ticks
+        mean = self._lateness_sum / n if n else 0.0
+        jitter = math.sqrt(max(self._lateness_sq / n - mean * mean, 0.0)) if n else 0.0
+        return {
+            "ticks": n, "elapsed": elapsed,
+            "rate": n / elapsed if elapsed > 0 else 0.0,
+            "target_rate": 1.0 / self.interval if self.interval > 0 else math.inf,
+            "mean_lateness": mean, "max_lateness": self._lateness_max, "jitter": jitter,
+        }
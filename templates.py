@@ -0,0 +1,301 @@
+"""
+Versioned template files.
+
+A template is a JSON object with a format tag and version, the action list
+and the subroutines it calls:
+
+    {"format":"clicker-template","version":2,"actions":[...],"subroutines":{...}}
+
+Actions are validated against `SCHEMA` and normalized on load (colors and
+regions become tuples, unset fields are dropped) and written compactly.
+Files ending in `.jsonl` use a streaming variant: a header line, then one
+action per line, then one `{"subroutine": name, "actions": [...]}` line per
+subroutine, so large recorded templates can be loaded and validated
+incrementally by `TemplateLoader` without blocking the UI. Version 1 files
+(a bare JSON list of actions) are still read, and `export_json` writes them.
+"""
+import json
+import queue
+import threading
+
+FORMAT = "clicker-template"
+VERSION = 2
+
+
+class TemplateFormatError(ValueError):
+    """Raised when a template file or action does not match the schema."""
+
+
+# --- Field validators: return the normalized value or raise TemplateFormatError ---
+def _int(value):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise TemplateFormatError(f"expected an integer, got {value!r}")
+    return value
+
+
+def _number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise TemplateFormatError(f"expected a number, got {value!r}")
+    return value
+
+
+def _text(value):
+    if not isinstance(value, str) or not value:
+        raise TemplateFormatError(f"expected a non-empty string, got {value!r}")
+    return value
+
+
+def _ints(count, low=None, high=None):
+    def check(value):
+        if not isinstance(value, (list, tuple)) or len(value) != count:
+            raise TemplateFormatError(f"expected {count} integers, got {value!r}")
+        for v in value:
+            _int(v)
+            if (low is not None and v < low) or (high is not None and v > high):
+                raise TemplateFormatError(f"values must be in {low}-{high}, got {value!r}")
+        return tuple(value)
+    return check
+
+
+def _choice(*options):
+    def check(value):
+        if value not in options:
+            raise TemplateFormatError(f"expected one of {', '.join(options)}, got {value!r}")
+        return value
+    return check
+
+
+_CONDITION = {
+    "color": _ints(3, 0, 255), "tolerance": _number, "region": _ints(4),
+    "match_percent": _number, "template": _text, "threshold": _number,
+}
+_POINT = {"x": _int, "y": _int}
+_INPUT = dict(_CONDITION, delay=_number) # Input actions may carry a recorded delay
+
+# Action type -> (required fields, optional fields); each maps a field name to its validator
+SCHEMA = {
+    "Left Click": (_POINT, _INPUT),
+    "Right Click": (_POINT, _INPUT),
+    "Double Click": (_POINT, _INPUT),
+    "Scroll": (dict(_POINT, amount=_int), _INPUT),
+    "Move": (_POINT, _INPUT),
+    "Key Press": ({"key": _text}, {"delay": _number}),
+    "Wait For": (_POINT, dict(_CONDITION, until=_choice("appears", "disappears"), timeout=_number)),
+    "Label": ({"name": _text}, {}),
+    "Jump": ({"name": _text}, dict(_CONDITION, x=_int, y=_int, when=_choice("always", "fail", "match"))),
+    "Repeat": ({"count": _int}, {}),
+    "End Repeat": ({}, {}),
+    "Call": ({"name": _text}, {}),
+}
+
+
+def normalize_action(action):
+    """Validates `action` against `SCHEMA` and returns a normalized copy with unset (None) fields dropped."""
+    if not isinstance(action, dict):
+        raise TemplateFormatError(f"expected an action object, got {type(action).__name__}")
+    action_type = action.get("type")
+    if action_type not in SCHEMA:
+        raise TemplateFormatError(f"unknown action type {action_type!r}")
+    required, optional = SCHEMA[action_type]
+    normalized = {"type": action_type}
+    for name, value in action.items():
+        if name == "type" or value is None:
+            continue
+        check = required.get(name) or optional.get(name)
+        if check is None:
+            raise TemplateFormatError(f"unknown field {name!r} for {action_type}")
+        try:
+            normalized[name] = check(value)
+        except TemplateFormatError as e:
+            raise TemplateFormatError(f"field {name!r}: {e}") from None
+    missing = [name for name in required if name not in normalized]
+    if action_type == "Jump" and normalized.get("when", "always") != "always":
+        missing += [name for name in _POINT if name not in normalized] # A conditional jump checks a point
+    if missing:
+        raise TemplateFormatError(f"{action_type} is missing {', '.join(repr(m) for m in missing)}")
+    return normalized
+
+
+def normalize_actions(actions, where="action"):
+    if not isinstance(actions, list):
+        raise TemplateFormatError(f"expected a list of actions, got {type(actions).__name__}")
+    normalized = []
+    for i, action in enumerate(actions):
+        try:
+            normalized.append(normalize_action(action))
+        except TemplateFormatError as e:
+            raise TemplateFormatError(f"{where} {i + 1}: {e}") from None
+    return normalized
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def _header(data):
+    if data.get("format") != FORMAT:
+        raise TemplateFormatError("not a Clicker template")
+    if not isinstance(data.get("version"), int) or data["version"] > VERSION:
+        raise TemplateFormatError(f"unsupported template version {data.get('version')!r} (this version reads up to {VERSION})")
+
+
+def called_subroutines(actions, subroutines):
+    """Returns the subset of `subroutines` reachable from `actions` through Call actions."""
+    found, pending = {}, [a["name"] for a in actions if a.get("type") == "Call"]
+    while pending:
+        name = pending.pop()
+        if name in found or name not in subroutines: continue
+        found[name] = subroutines[name]
+        pending.extend(a["name"] for a in subroutines[name] if a.get("type") == "Call")
+    return found
+
+
+# --- Reading ---
+def iter_template(path):
+    """
+    Yields the contents of a template file incrementally, validating as it goes:
+    `("action", action)` and `("subroutine", name, actions)` items, in file order.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        first = f.readline()
+        try:
+            header = json.loads(first) if first.strip() else None
+        except json.JSONDecodeError:
+            header = None
+        if isinstance(header, dict) and header.get("encoding") == "jsonl":
+            _header(header)
+            for number, line in enumerate(f, start=2):
+                if not line.strip(): continue
+                try:
+                    item = json.loads(line)
+                    if isinstance(item, dict) and "subroutine" in item:
+                        yield "subroutine", _text(item["subroutine"]), normalize_actions(item.get("actions"))
+                    else:
+                        yield "action", normalize_action(item)
+                except (json.JSONDecodeError, TemplateFormatError) as e:
+                    raise TemplateFormatError(f"line {number}: {e}") from None
+            return
+        rest = f.read()
+        if header is not None and not rest.strip():
+            data = header # A compact one-line file, already parsed
+        else:
+            try:
+                data = json.loads(first + rest)
+            except json.JSONDecodeError as e:
+                raise TemplateFormatError(f"invalid JSON: {e}") from None
+
+    if isinstance(data, list): # Version 1: a bare action list
+        actions, subroutines = data, {}
+    elif isinstance(data, dict):
+        _header(data)
+        actions, subroutines = data.get("actions", []), data.get("subroutines", {})
+        if not isinstance(subroutines, dict):
+            raise TemplateFormatError("'subroutines' must map names to action lists")
+    else:
+        raise TemplateFormatError("not a Clicker template")
+    for action in normalize_actions(actions):
+        yield "action", action
+    for name, body in subroutines.items():
+        yield "subroutine", name, normalize_actions(body, f"subroutine '{name}', action")
+
+
+def load_template(path):
+    """Reads a whole template file. Returns (actions, subroutines)."""
+    actions, subroutines = [], {}
+    for item in iter_template(path):
+        if item[0] == "action": actions.append(item[1])
+        else: subroutines[item[1]] = item[2]
+    return actions, subroutines
+
+
+# --- Writing ---
+def save_template(path, actions, subroutines=None):
+    """
+    Writes `actions` and the `subroutines` they call in the current format,
+    as JSON lines if `path` ends in '.jsonl', compact JSON otherwise.
+    """
+    actions = normalize_actions(actions)
+    subroutines = {name: normalize_actions(body) for name, body in called_subroutines(actions, subroutines or {}).items()}
+    with open(path, "w", encoding="utf-8") as f:
+        if path.lower().endswith(".jsonl"):
+            f.write(_dumps({"format": FORMAT, "version": VERSION, "encoding": "jsonl"}) + "\n")
+            for action in actions: f.write(_dumps(action) + "\n")
+            for name, body in subroutines.items(): f.write(_dumps({"subroutine": name, "actions": body}) + "\n")
+        else:
+            f.write(_dumps({"format": FORMAT, "version": VERSION, "actions": actions, "subroutines": subroutines}))
+
+
+def save_library(path, subroutines):
+    """Writes a subroutine library: a template with no actions of its own."""
+    subroutines = {name: normalize_actions(body) for name, body in subroutines.items()}
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(_dumps({"format": FORMAT, "version": VERSION, "actions": [], "subroutines": subroutines}))
+
+
+def load_library(path):
+    """Reads the subroutines of a template or library file, or a plain {name: actions} object."""
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise TemplateFormatError(f"invalid JSON: {e}") from None
+    if isinstance(data, dict) and "format" not in data:
+        return {name: normalize_actions(body, f"subroutine '{name}', action") for name, body in data.items()}
+    return load_template(path)[1]
+
+
+def export_json(path, actions):
+    """Writes `actions` as a plain, indented JSON list (the version 1 format)."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(normalize_actions(actions), f, indent=4)
+
+
+class TemplateLoader:
+    """
+    Loads a template on a background thread and hands the actions over in
+    batches, so a Tk timer can append them without freezing the main loop.
+
+    Call `poll` from the UI thread until it reports the load as finished;
+    then `error` is set if the file was invalid, and `subroutines` holds any
+    subroutines the file defined.
+    """
+    def __init__(self, path, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        self.subroutines = {}
+        self.error = None
+        self.loaded = 0
+        self._queue = queue.SimpleQueue()
+        self._cancelled = False
+        self._thread = threading.Thread(target=self._run, name="template-loader", daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled = True
+
+    def _run(self):
+        batch = []
+        try:
+            for item in iter_template(self.path):
+                if self._cancelled: break
+                if item[0] == "action":
+                    batch.append(item[1])
+                    if len(batch) >= self.batch_size:
+                        self._queue.put(batch); batch = []
+                else:
+                    self.subroutines[item[1]] = item[2]
+            if batch: self._queue.put(batch)
+        except (OSError, UnicodeDecodeError, TemplateFormatError) as e:
+            self.error = e
+        self._queue.put(None)
+
+    def poll(self, max_batches=4):
+        """Returns (batches of actions ready now, finished)."""
+        batches = []
+        while len(batches) < max_batches:
+            try: batch = self._queue.get_nowait()
+            except queue.Empty: return batches, False
+            if batch is None: return batches, True
+            self.loaded += len(batch)
+            batches.append(batch)
+        return batches, False
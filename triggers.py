@@ -0,0 +1,429 @@
+"""
+Trigger-driven sequences.
+
+The engine runs one sequence at a time on a blocking thread. `TriggerRunner`
+keeps any number of named sequences loaded, each started by its own trigger
+(a hotkey, a timer or a screen condition), and multiplexes them on a single
+asyncio event loop: a sequence waiting between actions or polling a Wait For
+costs nothing until its deadline, so a "watchdog" sequence (e.g. dismiss a
+popup when it appears) can run alongside the main loop.
+
+Physical input is exclusive. Each input call is made under a `PriorityLock`,
+granted to the highest-priority sequence waiting for it, and under the
+thread lock `input_lock`, which an `Engine` run shares by setting
+`engine.input_lock`. Input calls and screen captures block, so they run on
+one input thread and one capture thread; the event loop itself never waits
+on the desktop.
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from capture import FrameCache
+from engine import (IDLE_PASS_PAUSE, MAX_CALL_DEPTH, OP_ACT, OP_CALL, OP_END_REPEAT, OP_JUMP, OP_REPEAT, OP_RETURN, OP_WAIT,
+                    compile_actions, compile_condition)
+from logbuffer import DEBUG, INFO, WARNING, ERROR
+
+
+def _no_log(message, level=INFO):
+    pass
+
+
+class PriorityLock:
+    """
+    An asyncio lock that is handed to the highest-priority waiter on release
+    (first come, first served among equal priorities). `owner` is the name
+    of the current holder.
+    """
+    def __init__(self):
+        self.locked = False
+        self.owner = None
+        self._waiters = [] # Heap of (-priority, arrival, future, owner)
+        self._arrival = itertools.count()
+
+    async def acquire(self, priority=0, owner=None):
+        if not self.locked and not self._waiters:
+            self.locked, self.owner = True, owner
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (-priority, next(self._arrival), future, owner))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled(): self.release() # Granted just before the cancel; pass it on
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future, owner = heapq.heappop(self._waiters)
+            if not future.done(): # Skip waiters that were cancelled
+                self.owner = owner
+                future.set_result(True)
+                return
+        self.locked, self.owner = False, None
+
+    @asynccontextmanager
+    async def hold(self, priority=0, owner=None):
+        await self.acquire(priority, owner)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class Trigger:
+    """Starts a sequence only when `TriggerRunner.fire` is called."""
+    def __str__(self):
+        return "manual"
+
+    async def watch(self, runner, sequence):
+        await asyncio.Event().wait()
+
+
+class HotkeyTrigger(Trigger):
+    """Starts the sequence when `hotkey` (a `keyboard` hotkey such as 'ctrl+shift+1') is pressed."""
+    def __init__(self, hotkey):
+        self.hotkey = hotkey
+
+    def __str__(self):
+        return f"hotkey {self.hotkey}"
+
+    async def watch(self, runner, sequence):
+        import keyboard
+        loop = asyncio.get_running_loop()
+        # The hook runs on the keyboard thread; hand the launch over to the event loop
+        handle = keyboard.add_hotkey(self.hotkey, loop.call_soon_threadsafe, args=(runner.launch, sequence))
+        try:
+            await asyncio.Event().wait()
+        finally:
+            keyboard.remove_hotkey(handle)
+
+
+class TimerTrigger(Trigger):
+    """Starts the sequence every `interval` seconds, the first time after `initial` seconds (default: `interval`)."""
+    def __init__(self, interval, initial=None):
+        if interval <= 0: raise ValueError("a timer interval must be positive")
+        self.interval = interval
+        self.initial = interval if initial is None else initial
+
+    def __str__(self):
+        return f"every {self.interval:g}s"
+
+    async def watch(self, runner, sequence):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.initial
+        while True:
+            await asyncio.sleep(max(deadline - loop.time(), 0.0))
+            runner.launch(sequence)
+            deadline = max(deadline + self.interval, loop.time()) # Skip ticks missed while the loop was busy
+
+
+class ScreenTrigger(Trigger):
+    """
+    Starts the sequence when a screen condition becomes true, checking it
+    every `interval` seconds. `action` holds the condition fields of an
+    action (x/y and color, region or template). The trigger fires again only
+    after the condition has been false in between.
+    """
+    def __init__(self, action, interval=0.25):
+        self.condition = compile_condition(action)
+        self.interval = interval
+
+    def __str__(self):
+        return f"screen condition in {self.condition.region}"
+
+    async def watch(self, runner, sequence):
+        capture = FrameCache(ttl=None, grab=runner.backend.screenshot)
+        capture.watch([self.condition.region])
+        was_met = False
+        while True:
+            capture.invalidate()
+            met = bool(await runner.test(self.condition, capture))
+            if met and not was_met: runner.launch(sequence)
+            was_met = met
+            await asyncio.sleep(self.interval)
+
+
+class Sequence:
+    """A named, compiled sequence with its trigger and run settings, plus counters updated while it runs."""
+    def __init__(self, name, plan, trigger, priority=0, loops=1, delay=0.1, stop_on_fail=False, time_scale=1.0, frame_ttl=0.1, grab=None):
+        self.name = name
+        self.plan = plan
+        self.trigger = trigger
+        self.priority = priority
+        self.loops = loops
+        self.delay = delay
+        self.stop_on_fail = stop_on_fail
+        self.time_scale = time_scale
+        self.capture = FrameCache(ttl=frame_ttl, grab=grab)
+        self.capture.watch(ins.condition.region for ins in plan if ins.condition)
+        self.task = None
+        self.watcher = None
+        self.runs = 0
+        self.actions = 0
+        self.lock_waits = 0
+        self.lock_wait_total = 0.0
+        self.lock_wait_max = 0.0
+
+    @property
+    def running(self):
+        return self.task is not None and not self.task.done()
+
+    def status(self):
+        return {
+            "trigger": str(self.trigger), "priority": self.priority, "running": self.running, "runs": self.runs,
+            "actions": self.actions, "lock_wait_mean": self.lock_wait_total / self.lock_waits if self.lock_waits else 0.0,
+            "lock_wait_max": self.lock_wait_max,
+        }
+
+
+class TriggerRunner:
+    """
+    Runs triggered sequences on one event loop thread, started with `start`
+    and ended with `stop`. `add`, `remove`, `fire` and `status` are safe to
+    call from any thread, before or after `start`. A sequence that is
+    triggered while it is still running is not started again.
+    """
+    def __init__(self, backend, log=None, input_lock=None):
+        self.backend = backend
+        self.log = log or _no_log
+        self.input_lock = input_lock or threading.Lock()
+        self.sequences = {}
+        self._lock = None
+        self._loop = None
+        self._stopping = None
+        self._thread = None
+        self._input = self._capture = None
+
+    @property
+    def active(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def add(self, name, actions, trigger=None, priority=0, loops=1, delay=0.1, stop_on_fail=False, speed=1.0, turbo=False, subroutines=None, frame_ttl=0.1):
+        """
+        Compiles `actions` and adds them as sequence `name` (replacing one of
+        the same name). Higher `priority` sequences get the input first when
+        several want it. `loops=0` repeats until the sequence is cancelled;
+        `delay` is the pause after each action and `speed` scales recorded
+        delays (0 ignores them). `frame_ttl` is the maximum age of the frame
+        conditions are checked on, as in `Engine.run` (None keeps it for the
+        whole pass). Raises `TemplateError` for invalid actions.
+        """
+        plan = compile_actions(actions, self.backend, turbo, subroutines)
+        sequence = Sequence(name, plan, trigger or Trigger(), priority, loops, delay, stop_on_fail, 1 / speed if speed else None, frame_ttl, self.backend.screenshot)
+        self._call(self._add, sequence)
+        return sequence
+
+    def remove(self, name):
+        """Cancels sequence `name` and its trigger."""
+        self._call(self._remove, name)
+
+    def fire(self, name):
+        """Starts sequence `name` now, whatever its trigger."""
+        if name not in self.sequences: raise KeyError(f"Unknown sequence: {name}")
+        if not self.active: raise RuntimeError("Triggers are not running")
+        self._call(lambda: self.launch(self.sequences[name]))
+
+    def status(self):
+        return {name: sequence.status() for name, sequence in list(self.sequences.items())}
+
+    def _call(self, function, *args):
+        """Runs `function` on the event loop thread, or right away if the loop is not running."""
+        if self.active: self._loop.call_soon_threadsafe(function, *args)
+        else: function(*args)
+
+    # --- Lifecycle ---
+    def start(self):
+        if self.active: return
+        self._input = ThreadPoolExecutor(1, thread_name_prefix="trigger-input")
+        self._capture = ThreadPoolExecutor(1, thread_name_prefix="trigger-capture")
+        started = threading.Event()
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._main(started)), name="triggers", daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop(self, timeout=5.0):
+        """Cancels every running sequence and trigger and waits for the event loop thread to end."""
+        if not self.active: return
+        self._loop.call_soon_threadsafe(self._stopping.set)
+        self._thread.join(timeout)
+        self._input.shutdown(wait=False)
+        self._capture.shutdown(wait=False)
+
+    async def _main(self, started):
+        self._loop = asyncio.get_running_loop()
+        self._lock = PriorityLock()
+        self._stopping = asyncio.Event()
+        for sequence in self.sequences.values(): self._watch(sequence)
+        started.set()
+        self.log(f"Triggers active: {len(self.sequences)} sequence(s).")
+        try:
+            await self._stopping.wait()
+        finally:
+            tasks = [t for s in self.sequences.values() for t in (s.watcher, s.task) if t is not None]
+            for task in tasks: task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for sequence in self.sequences.values(): sequence.watcher = sequence.task = None
+            self.log("Triggers stopped.")
+
+    def _add(self, sequence):
+        if sequence.name in self.sequences: self._remove(sequence.name)
+        self.sequences[sequence.name] = sequence
+        if self.active: self._watch(sequence)
+
+    def _remove(self, name):
+        sequence = self.sequences.pop(name, None)
+        if sequence is None: return
+        for task in (sequence.watcher, sequence.task):
+            if task is not None: task.cancel()
+
+    def _watch(self, sequence):
+        sequence.watcher = self._loop.create_task(sequence.trigger.watch(self, sequence), name=f"trigger:{sequence.name}")
+        sequence.watcher.add_done_callback(lambda task: self._watch_done(sequence, task))
+
+    def _watch_done(self, sequence, task):
+        if not task.cancelled() and task.exception() is not None:
+            self.log(f"Trigger of '{sequence.name}' ({sequence.trigger}) stopped: {task.exception()}", ERROR)
+
+    def launch(self, sequence):
+        """Starts `sequence` unless it is already running. Must be called on the event loop thread."""
+        if sequence.running:
+            self.log(f"'{sequence.name}' is still running; trigger ignored.", DEBUG)
+            return
+        self.log(f"Triggered '{sequence.name}' ({sequence.trigger}).")
+        sequence.task = self._loop.create_task(self._run(sequence), name=f"sequence:{sequence.name}")
+
+    async def _run(self, sequence):
+        try:
+            await self._execute(sequence)
+        except asyncio.CancelledError:
+            self.log(f"'{sequence.name}' cancelled.", DEBUG)
+            raise
+        except Exception as e:
+            self.log(f"'{sequence.name}' failed: {e}", ERROR)
+        finally:
+            sequence.runs += 1
+
+    # --- Execution ---
+    async def test(self, condition, capture):
+        """Tests `condition` on the capture thread."""
+        return await self._loop.run_in_executor(self._capture, condition.test, capture)
+
+    def _dispatch(self, ins, hit):
+        with self.input_lock:
+            if ins.retarget: ins.call(*hit)
+            else: ins.call()
+
+    async def _act(self, sequence, ins, hit):
+        """Makes the input call of `ins` once `sequence` holds the input lock."""
+        loop = self._loop
+        requested = loop.time()
+        async with self._lock.hold(sequence.priority, sequence.name):
+            waited = loop.time() - requested
+            await loop.run_in_executor(self._input, self._dispatch, ins, hit)
+        sequence.actions += 1
+        sequence.lock_waits += 1
+        sequence.lock_wait_total += waited
+        if waited > sequence.lock_wait_max: sequence.lock_wait_max = waited
+
+    async def _wait_for(self, ins):
+        """The awaitable counterpart of `Engine.wait_for`: polls the condition's own region with a growing interval, sleeping in between."""
+        loop = self._loop
+        capture = FrameCache(ttl=None, grab=self.backend.screenshot)
+        capture.watch([ins.condition.region])
+        deadline = loop.time() + ins.timeout
+        poll = 0.01
+        while True:
+            capture.invalidate()
+            if bool(await self.test(ins.condition, capture)) == ins.until: return True
+            remaining = deadline - loop.time()
+            if remaining <= 0: return False
+            await asyncio.sleep(min(poll, remaining))
+            poll = min(poll * 2, 0.1)
+
+    async def _pace(self, sequence, deadline, gap):
+        """Sleeps until `gap` seconds after `deadline` and returns the new deadline."""
+        loop = self._loop
+        deadline = max(deadline + gap, loop.time() - sequence.delay) # Don't burst to catch up after a long wait for the lock
+        await asyncio.sleep(max(deadline - loop.time(), 0.0))
+        return deadline
+
+    async def _execute(self, sequence):
+        """
+        Interprets the plan like `Engine._execute`, awaiting instead of
+        blocking whenever it waits. Loops that jump back without acting, and
+        passes without actions, sleep for the sequence's delay so they never
+        hold the event loop.
+        """
+        log, loop, name = self.log, self._loop, sequence.name
+        code, capture = sequence.plan.code, sequence.capture
+        counters = [0] * len(code)
+        stack = []
+        passes = acted = 0
+        deadline = loop.time()
+        while sequence.loops == 0 or passes < sequence.loops:
+            capture.invalidate()
+            ip = 0
+            pass_acted = jump_acted = acted
+            pending = False # An action's pacing sleep is deferred until the next action and its recorded delay are known
+            stack.clear()
+            while True:
+                ins = code[ip]
+                op = ins.op
+                if op == OP_ACT:
+                    if pending:
+                        gap = sequence.delay if ins.delay is None or sequence.time_scale is None else ins.delay * sequence.time_scale
+                        deadline = await self._pace(sequence, deadline, gap)
+                    ip += 1
+                    acted += 1
+                    pending = True
+                    hit = await self.test(ins.condition, capture) if ins.condition else True
+                    if hit:
+                        log(f"[{name}] Executing: {ins.text}", DEBUG)
+                        await self._act(sequence, ins, hit)
+                    else:
+                        log(f"[{name}] {ins.condition}", WARNING)
+                        if sequence.stop_on_fail: return
+                elif op == OP_JUMP:
+                    if ins.condition is None or bool(await self.test(ins.condition, capture)) == ins.until:
+                        if ins.target <= ip:
+                            # A loop back: take a fresh frame, and sleep if it ran no action (a polling or empty loop)
+                            capture.invalidate()
+                            if acted == jump_acted and not pending: await asyncio.sleep(sequence.delay)
+                            jump_acted = acted
+                        ip = ins.target
+                    else: ip += 1
+                elif op == OP_REPEAT:
+                    counters[ip] = ins.count
+                    ip = ip + 1 if ins.count > 0 else ins.target
+                elif op == OP_END_REPEAT:
+                    counters[ins.target] -= 1
+                    ip = ins.target + 1 if counters[ins.target] > 0 else ip + 1
+                elif op == OP_CALL:
+                    if len(stack) >= MAX_CALL_DEPTH:
+                        log(f"[{name}] Call depth limit ({MAX_CALL_DEPTH}) exceeded at: {ins.text}", WARNING)
+                        return
+                    stack.append(ip + 1)
+                    ip = ins.target
+                elif op == OP_RETURN:
+                    ip = stack.pop()
+                elif op == OP_WAIT:
+                    if pending: deadline = await self._pace(sequence, deadline, sequence.delay)
+                    pending = False
+                    ip += 1
+                    met = await self._wait_for(ins)
+                    deadline = loop.time()
+                    if not met:
+                        log(f"[{name}] Timed out after {ins.timeout:g}s: {ins.text}", WARNING)
+                        if sequence.stop_on_fail: return
+                else: # OP_END
+                    if pending: deadline = await self._pace(sequence, deadline, sequence.delay)
+                    break
+            passes += 1
+            if acted == pass_acted: # Nothing paced this pass
+                await asyncio.sleep(max(sequence.delay, IDLE_PASS_PAUSE))
+                deadline = loop.time()
+        log(f"'{name}' finished after {passes} loop(s).", DEBUG)